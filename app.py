@@ -7,13 +7,27 @@ import os
 import time
 import json
 import csv
+import zlib
+import functools
 from io import StringIO
 from datetime import datetime
-from flask import Flask, jsonify, render_template, request, Response
+from flask import Flask, jsonify, render_template, request, Response, g
 from flask_cors import CORS
 
 from gpu_monitor import get_monitor
-from carbon_utils import get_calculator
+from carbon_utils import get_calculator, create_session, ELECTRICITY_MAPS_API_URL
+from sampler import get_sampler
+from sqlite_store import SQLiteStore
+from rollups import Downsampler, TierSpec
+from lttb import lttb_indices
+from broadcast import format_event
+from prometheus import CONTENT_TYPE as PROMETHEUS_CONTENT_TYPE
+from serialization import dumps, JSON_MIMETYPE
+from compression import compress, compress_stream, choose_encoding
+from wire import (
+    ARROW_MIMETYPE, MSGPACK_MIMETYPE, PARQUET_MIMETYPE, AVAILABLE_FORMATS,
+    encode_arrow, encode_msgpack, iter_arrow_stream, iter_msgpack_stream, iter_parquet, write_parquet
+)
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -22,13 +36,224 @@ CORS(app)  # Enable CORS for API access
 # Get optional API key from environment
 CARBON_API_KEY = os.environ.get("ELECTRICITY_MAPS_API_KEY")
 
+# Upstream endpoint (override to point at a local stand-in server) and HTTP pool size
+CARBON_API_URL = os.environ.get("ELECTRICITY_MAPS_API_URL", ELECTRICITY_MAPS_API_URL)
+CARBON_HTTP_POOL_SIZE = int(os.environ.get("CARBON_HTTP_POOL_SIZE", "10"))
+
+# Power integration method when no hardware energy counter is available
+ENERGY_INTEGRATION_METHOD = os.environ.get("ENERGY_INTEGRATION_METHOD", "trapezoid")
+
+# Number of GPUs emulated when no NVML device is available
+SIMULATED_GPU_COUNT = int(os.environ.get("SIMULATED_GPU_COUNT", "1"))
+
+# Sampling rate of the background collector (samples per second)
+SAMPLE_RATE_HZ = float(os.environ.get("SAMPLE_RATE_HZ", "1.0"))
+
+# Per-zone carbon intensity cache
+CARBON_CACHE_TTL = float(os.environ.get("CARBON_CACHE_TTL", "300"))
+CARBON_CACHE_SIZE = int(os.environ.get("CARBON_CACHE_SIZE", "32"))
+CARBON_MAX_STALENESS = float(os.environ.get("CARBON_MAX_STALENESS", "3600"))
+
+# Historical data storage (in-memory ring buffer)
+MAX_HISTORY_POINTS = int(os.environ.get("MAX_HISTORY_POINTS", "1000"))
+
+# Optional persistent history (SQLite, WAL mode); unset keeps history in memory only
+HISTORY_DB_PATH = os.environ.get("HISTORY_DB_PATH")
+HISTORY_DB_BATCH_SIZE = int(os.environ.get("HISTORY_DB_BATCH_SIZE", "100"))
+HISTORY_DB_FLUSH_INTERVAL = float(os.environ.get("HISTORY_DB_FLUSH_INTERVAL", "1.0"))
+HISTORY_DB_RETENTION = float(os.environ.get("HISTORY_DB_RETENTION", "86400"))  # Raw samples, seconds
+
+# Rollup tiers (per-minute and per-hour buckets) and their retention in seconds
+ROLLUP_TIERS = (
+    TierSpec("1m", 60, int(os.environ.get("ROLLUP_1M_RETENTION", str(7 * 24 * 3600)))),
+    TierSpec("1h", 3600, int(os.environ.get("ROLLUP_1H_RETENTION", str(90 * 24 * 3600)))),
+)
+
+# Rows formatted per chunk when streaming CSV exports
+EXPORT_CHUNK_ROWS = 1000
+
+# Parquet exports: rows per row group, codec, and the directory `path=` exports are written to
+PARQUET_ROW_GROUP_ROWS = int(os.environ.get("PARQUET_ROW_GROUP_ROWS", "100000"))
+PARQUET_COMPRESSION = os.environ.get("PARQUET_COMPRESSION", "zstd")
+EXPORT_DIR = os.environ.get("EXPORT_DIR")  # Unset disables writing exports on the server
+
+# gzip/brotli response compression for /history and /export/sessions
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))  # Smaller bodies go uncompressed
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "5"))
+
+# Series returned by /history?points=N (history store column names)
+LTTB_SERIES = [
+    'power_watts', 'temperature_celsius', 'utilization_percent', 'memory_percent',
+    'intensity_g_per_kwh', 'emissions_g_per_second', 'emissions_total_g'
+]
+
 # Initialize components
-gpu_monitor = get_monitor()
-carbon_calc = get_calculator(CARBON_API_KEY)
+gpu_monitor = get_monitor(simulated_devices=SIMULATED_GPU_COUNT)
+carbon_calc = get_calculator(
+    CARBON_API_KEY,
+    cache_ttl=CARBON_CACHE_TTL,
+    cache_size=CARBON_CACHE_SIZE,
+    max_staleness=CARBON_MAX_STALENESS,
+    session=create_session(pool_size=CARBON_HTTP_POOL_SIZE),
+    api_url=CARBON_API_URL,
+    integration_method=ENERGY_INTEGRATION_METHOD
+)
+history_db = SQLiteStore(
+    HISTORY_DB_PATH,
+    batch_size=HISTORY_DB_BATCH_SIZE,
+    flush_interval=HISTORY_DB_FLUSH_INTERVAL,
+    retention=HISTORY_DB_RETENTION,
+    rollup_retention={tier.name: tier.retention_seconds for tier in ROLLUP_TIERS}
+) if HISTORY_DB_PATH else None
+rollups = Downsampler(ROLLUP_TIERS, on_close=history_db.append_rollup if history_db else None)
+if history_db is not None:
+    # Rollups survive restarts: reload buckets still within retention, including the open ones
+    history_db.restore_rollups(rollups)
+sampler = get_sampler(
+    gpu_monitor, carbon_calc, hz=SAMPLE_RATE_HZ, max_history=MAX_HISTORY_POINTS,
+    store=history_db, rollups=rollups
+)
+sampler.start()
+
+# History routes read the persistent store when configured, else the in-memory ring buffer
+history_store = history_db if history_db is not None else sampler.history
+
+
+def _json_bytes(body: bytes, status: int = 200) -> Response:
+    """Response for an already-encoded JSON body"""
+    return Response(body, status=status, mimetype=JSON_MIMETYPE)
+
+
+def _negotiate(default: str, offered=(ARROW_MIMETYPE, MSGPACK_MIMETYPE), mimetype=None):
+    """
+    Response format: `mimetype` if given, else picked from the Accept header
+    among `default` and the `offered` binary formats.
+    Returns (mimetype, error response or None).
+    """
+    if mimetype is None:
+        mimetype = request.accept_mimetypes.best_match([default, *offered], default)
+    if not AVAILABLE_FORMATS.get(mimetype, True):
+        module = 'msgpack' if mimetype == MSGPACK_MIMETYPE else 'pyarrow'
+        return mimetype, (jsonify({"error": f"{mimetype} requires the optional '{module}' package"}), 406)
+    return mimetype, None
+
+
+# Bodies that are already compressed
+_PRECOMPRESSED_MIMETYPES = ('application/gzip', PARQUET_MIMETYPE)
+
+# Sequence numbers restart on every process start, so tags also carry a per-boot ID
+_BOOT_ID = os.urandom(4).hex()
+
+
+def _raw_covers(start_time) -> bool:
+    """Whether raw samples still reach back to start_time (nothing before it was evicted)"""
+    oldest = history_store.get_positions(history_store.start_position, history_store.start_position + 1)
+    return start_time is None or history_store.start_position == 0 or (
+        bool(oldest) and oldest[0]['timestamp'] <= start_time)
+
+
+def _closed_window():
+    """
+    Raw positions [start, stop) of the request's time window if its response
+    can no longer change: it is served from raw samples, ends at end_time, and
+    a later sample is already stored, so no new one can land in it (timestamps
+    never decrease). Eviction into the window moves `start`. None otherwise.
+    """
+    start_time = request.args.get('start_time', type=float) or None
+    end_time = request.args.get('end_time', type=float) or None
+    if end_time is None or 'after_seq' in request.args:
+        return None
+    start, stop = history_store.positions_between(start_time, end_time)
+    if stop >= history_store.end_position:
+        return None
+    if request.endpoint == 'get_history':
+        mimetype, _ = _negotiate(JSON_MIMETYPE)
+        resolution = request.args.get('resolution', 'auto')
+        limit = max(request.args.get('limit', type=int, default=100), 0)
+        # Mirrors get_history's choice; rollup buckets keep changing while open
+        raw = mimetype != JSON_MIMETYPE or 'points' in request.args or resolution == 'raw' or (
+            resolution == 'auto' and _raw_covers(start_time) and stop - start <= limit)
+        if not raw:
+            return None
+    return start, stop
+
+
+def _history_etag() -> str:
+    """
+    Validator for a history read, scoped to this process and to this
+    request's query and Accept header: a closed window's own positions, else
+    the latest sample sequence number plus the retained range.
+    """
+    scope = zlib.crc32(f"{request.full_path}|{request.headers.get('Accept', '')}".encode('utf-8'))
+    window = _closed_window()
+    if window is not None:
+        return f"{_BOOT_ID}-w{window[0]}-{window[1]}-{scope:08x}"
+    sequence = sampler.history.end_position  # Also covers rollups, which follow every sample
+    if history_store is sampler.history:
+        return f"{_BOOT_ID}-{sequence}-{history_store.start_position}-{scope:08x}"
+    # The database lags the sampler by up to one flush, so its range is part of the tag
+    return f"{_BOOT_ID}-{sequence}-{history_store.start_position}-{history_store.end_position}-{scope:08x}"
+
+
+def _compress_response(response: Response):
+    """Compress a response body with the client's preferred coding (streamed bodies on the fly)"""
+    if 'Content-Encoding' in response.headers or response.mimetype in _PRECOMPRESSED_MIMETYPES:
+        return
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return
+    options = {'gzip_level': GZIP_LEVEL, 'brotli_quality': BROTLI_QUALITY}
+    if response.is_streamed:
+        response.response = compress_stream(response.iter_encoded(), encoding, **options)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESSION_MIN_BYTES:
+            return
+        response.set_data(compress(body, encoding, **options))
+    response.headers['Content-Encoding'] = encoding
+
+
+def _revalidated(view):
+    """
+    ETag / If-None-Match handling and content encoding for history reads.
+    A client re-fetching a range with no new samples gets a 304 before any
+    data is read or encoded.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.args.get('path'):
+            return view(*args, **kwargs)  # Server-side exports have side effects; never skip them
+        etag = _history_etag()
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            _compress_response(response)
+        # Weak: the same data is served as identity, gzip or br
+        response.set_etag(etag, weak=True)
+        response.vary.update(('Accept', 'Accept-Encoding'))
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
+
 
-# Historical data storage (in-memory for simplicity, use database in production)
-historical_data = []
-MAX_HISTORY_POINTS = 1000
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _record_latency(response):
+    """Feed the request latency histograms of /metrics/prometheus"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        sampler.prometheus.observe_request(endpoint, request.method, time.perf_counter() - start)
+    return response
 
 
 @app.route("/")
@@ -39,86 +264,168 @@ def index():
 
 @app.route("/metrics")
 def metrics():
-    """API endpoint returning all current metrics as JSON"""
-    # Get region from query param or use default
-    region = request.args.get('region', 'US-CAL-CISO')
+    """API endpoint returning the latest sampled metrics as JSON"""
+    snapshot = sampler.latest()
+    if snapshot is None:
+        snapshot = sampler.sample_once()
     
-    # Get GPU metrics
-    gpu_metrics = gpu_monitor.get_metrics()
+    # Re-price the sampled power for a different zone without re-sampling the GPU
+    region = request.args.get('region')
+    if not region or region == sampler.zone:
+        # Serve the bytes the sampler already encoded
+        return _json_bytes(sampler.latest_encoded())
     
-    # Get carbon intensity
-    carbon_intensity = carbon_calc.fetch_carbon_intensity(zone=region)
-    
-    # Calculate emissions
+    reading = carbon_calc.get_reading(zone=region)
     carbon_data = carbon_calc.calculate_emissions(
-        gpu_metrics.power_watts,
-        carbon_intensity
+        snapshot['gpu']['power_watts'],
+        reading.intensity,
+        update_energy=False,
+        reading=reading
     )
-    
-    # Build response
-    response = {
-        "timestamp": time.time(),
-        "gpu": {
-            "name": gpu_metrics.gpu_name,
-            "power_watts": round(gpu_metrics.power_watts, 2),
-            "temperature_celsius": round(gpu_metrics.temperature_celsius, 1),
-            "utilization_percent": round(gpu_metrics.utilization_percent, 1),
-            "memory_used_mb": round(gpu_metrics.memory_used_mb, 0),
-            "memory_total_mb": round(gpu_metrics.memory_total_mb, 0),
-            "memory_percent": round(
-                (gpu_metrics.memory_used_mb / gpu_metrics.memory_total_mb) * 100, 1
-            ),
-            "is_simulated": gpu_metrics.is_simulated
-        },
-        "carbon": {
-            "intensity_g_per_kwh": round(carbon_data.carbon_intensity_g_per_kwh, 1),
-            "is_mocked": carbon_data.is_mocked,
-            "region": carbon_data.region,
-            "emissions_g_per_second": round(carbon_data.emissions_grams_per_second, 6),
-            "emissions_g_per_minute": round(carbon_data.emissions_grams_per_second * 60, 4),
-            "emissions_total_g": round(carbon_data.emissions_grams_total, 4),
-            "suggestion": carbon_data.suggestion
-        },
-        "job": {
-            "running": carbon_calc.is_job_running(),
-            "runtime_seconds": round(carbon_calc.get_runtime_hours() * 3600, 1)
-        }
+    snapshot = dict(snapshot)
+    snapshot['carbon'] = {
+        "intensity_g_per_kwh": round(carbon_data.carbon_intensity_g_per_kwh, 1),
+        "is_mocked": carbon_data.is_mocked,
+        "is_stale": carbon_data.is_stale,
+        "region": carbon_data.region,
+        "emissions_g_per_second": round(carbon_data.emissions_grams_per_second, 6),
+        "emissions_g_per_minute": round(carbon_data.emissions_grams_per_second * 60, 4),
+        "emissions_total_g": round(carbon_data.emissions_grams_total, 4),
+        "suggestion": carbon_data.suggestion
     }
     
-    # Store in historical data
-    if len(historical_data) >= MAX_HISTORY_POINTS:
-        historical_data.pop(0)
-    historical_data.append(response)
-    
-    return jsonify(response)
+    return _json_bytes(dumps(snapshot))
+
+
+def _job_summary(job) -> dict:
+    """Final accounting of a stopped job"""
+    energy = carbon_calc.energy_report(job)
+    return {
+        "job_id": job.job_id,
+        "runtime_hours": round(job.runtime_seconds() / 3600, 4),
+        "total_energy_wh": round(job.energy_wh, 4),
+        "total_emissions_g": round(job.emissions_g, 4),
+        "energy_source": energy["source"],
+        "integration_method": energy["method"],
+        "energy_error_wh": round(energy["error_estimate_wh"], 6),
+        "energy_drift_wh": None if energy["drift_wh"] is None else round(energy["drift_wh"], 6)
+    }
+
+
+def _finish_job(job_id=None):
+    """Stop a job, then take a final sample so its energy up to the stop is counted"""
+    job = carbon_calc.stop_job(job_id)
+    sampler.sample_once()
+    # Keep the simulated load on while other jobs are still running
+    gpu_monitor.set_job_running(carbon_calc.is_job_running())
+    return job
+
+
+@app.route("/metrics/stream")
+def metrics_stream():
+    """Server-Sent Events: push every sampler tick to the client"""
+    encoded = sampler.latest_encoded()
+    initial = format_event(encoded) if encoded is not None else None
+    return Response(
+        sampler.broadcaster.stream(initial),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route("/metrics/prometheus")
+def metrics_prometheus():
+    """Prometheus text exposition, precomputed by the sampler on every tick"""
+    return Response(sampler.prometheus.render(), content_type=PROMETHEUS_CONTENT_TYPE)
 
 
 @app.route("/job/start", methods=["POST"])
 def start_job():
-    """Start a simulated heavy job"""
+    """
+    Start tracking a job. Optional JSON body:
+    {"gpu_index": 0, "pid": 1234, "name": "training"} - gpu_index attributes
+    only that GPU's energy, pid stops the job when the process exits.
+    """
+    body = request.get_json(silent=True) or {}
+    gpu_index = body.get("gpu_index")
+    pid = body.get("pid")
+    
+    if gpu_index is not None:
+        if not isinstance(gpu_index, int) or not 0 <= gpu_index < gpu_monitor.device_count:
+            return jsonify({
+                "status": "error",
+                "message": f"gpu_index must be between 0 and {gpu_monitor.device_count - 1}"
+            }), 400
+    if pid is not None and (not isinstance(pid, int) or pid <= 0):
+        return jsonify({"status": "error", "message": "pid must be a positive integer"}), 400
+    
     gpu_monitor.set_job_running(True)
-    carbon_calc.start_job()
-    return jsonify({"status": "started", "message": "Heavy job simulation started"})
+    job = carbon_calc.start_job(gpu_index=gpu_index, pid=pid, name=body.get("name"))
+    return jsonify({
+        "status": "started",
+        "message": "Heavy job simulation started",
+        "job_id": job.job_id,
+        "job": carbon_calc.jobs.describe(job.job_id)
+    })
 
 
 @app.route("/job/stop", methods=["POST"])
 def stop_job():
-    """Stop the simulated job"""
-    gpu_monitor.set_job_running(False)
+    """Stop the most recently started job"""
+    job = _finish_job()
     
-    # Get final emissions before stopping
-    final_emissions = carbon_calc.total_energy_wh
-    runtime = carbon_calc.get_runtime_hours()
-    
-    carbon_calc.stop_job()
+    if job is None:
+        return jsonify({
+            "status": "stopped",
+            "message": "No job was running",
+            "summary": {
+                "job_id": None,
+                "runtime_hours": 0.0,
+                "total_energy_wh": 0.0,
+                "total_emissions_g": 0.0,
+                "energy_source": None,
+                "integration_method": carbon_calc.integration_method,
+                "energy_error_wh": 0.0,
+                "energy_drift_wh": None
+            }
+        })
     
     return jsonify({
         "status": "stopped",
         "message": "Job simulation stopped",
-        "summary": {
-            "runtime_hours": round(runtime, 4),
-            "total_energy_wh": round(final_emissions, 4)
-        }
+        "summary": _job_summary(job)
+    })
+
+
+@app.route("/job/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Energy and emissions of one job so far"""
+    job = carbon_calc.jobs.describe(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"Unknown job '{job_id}'"}), 404
+    return jsonify(job)
+
+
+@app.route("/job/<job_id>/stop", methods=["POST"])
+def stop_job_by_id(job_id):
+    """Stop one job by ID"""
+    if carbon_calc.jobs.get(job_id) is None:
+        return jsonify({"status": "error", "message": f"Unknown job '{job_id}'"}), 404
+    job = _finish_job(job_id)
+    return jsonify({
+        "status": "stopped",
+        "message": "Job stopped",
+        "summary": _job_summary(job)
+    })
+
+
+@app.route("/jobs")
+def list_jobs():
+    """Running and recently finished jobs"""
+    jobs = carbon_calc.jobs.describe()
+    return jsonify({
+        "active": sum(1 for job in jobs if job["running"]),
+        "jobs": jobs
     })
 
 
@@ -128,77 +435,247 @@ def health():
     return jsonify({
         "status": "healthy",
         "gpu_mode": "simulated" if gpu_monitor.simulated else "real",
-        "carbon_api": "connected" if not carbon_calc.is_mocked else "mocked"
+        "gpu_count": gpu_monitor.device_count,
+        "gpus": [device.to_dict() for device in gpu_monitor.devices],
+        "carbon_api": "connected" if not carbon_calc.is_mocked else "mocked",
+        "sampler": {
+            "running": sampler.is_running(),
+            "rate_hz": SAMPLE_RATE_HZ,
+            "stream_subscribers": sampler.broadcaster.subscriber_count,
+            "samples": sampler.sample_count
+        }
     })
 
 
+@app.route("/carbon/cache")
+def carbon_cache_stats():
+    """Carbon intensity cache hit/miss counters"""
+    return jsonify(carbon_calc.cache.stats())
+
+
 @app.route("/history")
+@_revalidated
 def get_history():
-    """Get historical metrics data"""
+    """
+    Get historical metrics data.
+    
+    `resolution` is raw, 1m, 1h or auto. auto (the default when a time window
+    is given) returns the finest tier that covers the window within `limit`
+    points, so long ranges are served from per-minute or per-hour buckets.
+    
+    `after_seq` returns only raw samples newer than that sequence number,
+    oldest first, with the `next_cursor` to pass on the following call.
+    """
     # Optional query params for filtering
-    limit = request.args.get('limit', type=int, default=100)
-    start_time = request.args.get('start_time', type=float)
-    end_time = request.args.get('end_time', type=float)
+    limit = max(request.args.get('limit', type=int, default=100), 0)
+    start_time = request.args.get('start_time', type=float) or None
+    end_time = request.args.get('end_time', type=float) or None
+    resolution = request.args.get('resolution', 'auto' if start_time or end_time else 'raw')
     
-    filtered_data = historical_data
+    tiers = [tier.name for tier in ROLLUP_TIERS]
+    if resolution not in ['raw', 'auto'] + tiers:
+        return jsonify({"error": f"resolution must be one of raw, auto, {', '.join(tiers)}"}), 400
     
-    # Apply time filters
-    if start_time:
-        filtered_data = [d for d in filtered_data if d['timestamp'] >= start_time]
-    if end_time:
-        filtered_data = [d for d in filtered_data if d['timestamp'] <= end_time]
+    mimetype, error = _negotiate(JSON_MIMETYPE)
+    if error:
+        return error
     
-    # Apply limit
-    filtered_data = filtered_data[-limit:]
+    after_seq = request.args.get('after_seq', type=int)
+    if after_seq is not None:
+        if resolution not in ('raw', 'auto') or 'points' in request.args:
+            return jsonify({"error": "after_seq returns raw samples (no resolution or points)"}), 400
+        return _history_after(after_seq, start_time, end_time, mimetype)
     
-    return jsonify({
+    # Locate the time window by binary search
+    start, stop = history_store.positions_between(start_time, end_time)
+    
+    if mimetype != JSON_MIMETYPE:
+        return _history_binary(mimetype, start, stop, resolution)
+    
+    points = request.args.get('points', type=int)
+    if points is not None:
+        return _history_lttb(start, stop, points)
+    
+    if resolution == 'auto':
+        if _raw_covers(start_time) and stop - start <= limit:
+            resolution = 'raw'
+        else:
+            covering = [name for name in tiers if rollups.covers(name, start_time)] or tiers[-1:]
+            fitting = [name for name in covering if rollups.count_between(name, start_time, end_time) <= limit]
+            resolution = fitting[0] if fitting else covering[-1]
+    
+    if resolution == 'raw':
+        # Read only the window's newest `limit` records
+        start = max(start, stop - limit)
+        filtered_data = history_store.get_positions(start, stop)
+        return _json_bytes(dumps({
+            "count": len(filtered_data),
+            "resolution": resolution,
+            # Tail from here with after_seq
+            "next_cursor": filtered_data[-1]["seq"] if filtered_data else stop - 1,
+            "data": filtered_data
+        }))
+    
+    filtered_data = rollups.query(resolution, start_time, end_time, limit)
+    return _json_bytes(dumps({
         "count": len(filtered_data),
+        "resolution": resolution,
         "data": filtered_data
-    })
+    }))
+
+
+def _history_after(after_seq, start_time, end_time, mimetype):
+    """
+    Raw samples with seq > after_seq, oldest first: at most `limit` (default
+    100 for JSON, unlimited for binary formats), plus the cursor for the next
+    call. Reading costs O(new samples) since sequence numbers are positions.
+    """
+    latest = sampler.history.end_position
+    if after_seq >= latest:
+        # Not a sequence number this server handed out (e.g. in-memory history after a restart)
+        return jsonify({"error": "after_seq is ahead of the latest sample", "latest_seq": latest - 1}), 409
+    
+    # The sampler's ring holds the newest samples at the same positions as the database
+    store = sampler.history if sampler.history.start_position <= after_seq + 1 else history_store
+    start, stop = store.positions_between(start_time, end_time)
+    missed = max(0, store.start_position - (after_seq + 1))  # Evicted before the client caught up
+    start = max(start, after_seq + 1)
+    limit = request.args.get('limit', type=int, default=100 if mimetype == JSON_MIMETYPE else None)
+    end = stop if limit is None else max(start, min(stop, start + max(limit, 0)))
+    
+    # The cursor is the last seq actually returned, so nothing read concurrently is ever skipped
+    if mimetype != JSON_MIMETYPE:
+        columns = store.export_columns(start, end)
+        last = int(columns["seq"][-1]) if len(columns["seq"]) else after_seq
+        return _encode_columns(columns, mimetype, {"next_cursor": last, "has_more": last + 1 < stop, "missed": missed})
+    data = store.get_positions(start, end)
+    last = data[-1]["seq"] if data else after_seq
+    return _json_bytes(dumps({
+        "count": len(data),
+        "resolution": "raw",
+        "next_cursor": last,
+        "has_more": last + 1 < stop,
+        "missed": missed,
+        "data": data
+    }))
+
+
+def _history_binary(mimetype, start, stop, resolution):
+    """
+    Raw samples of positions [start, stop) as columns (Arrow IPC or MessagePack),
+    read straight from the store's arrays without building per-record dicts.
+    The whole window is returned unless `limit` is given explicitly.
+    """
+    if resolution not in ('raw', 'auto'):
+        return jsonify({"error": "binary formats serve raw samples only (resolution=raw)"}), 400
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        start = max(start, stop - max(limit, 0))
+    columns = history_store.export_columns(start, stop)
+    last = int(columns["seq"][-1]) if len(columns["seq"]) else stop - 1
+    return _encode_columns(columns, mimetype, {"next_cursor": last})
+
+
+def _encode_columns(columns, mimetype, cursor):
+    """
+    Exported history columns as an Arrow IPC or MessagePack body.
+    Cursor fields go in X-Next-Cursor / X-Has-More / X-Missed headers (and the MessagePack map).
+    """
+    if mimetype == ARROW_MIMETYPE:
+        body = encode_arrow(columns)
+    else:
+        body = encode_msgpack(columns, resolution="raw", **cursor)
+    headers = {f"X-{name.title().replace('_', '-')}": str(value).lower() for name, value in cursor.items()}
+    return Response(body, mimetype=mimetype, headers=headers)
+
+
+def _history_lttb(start, stop, points):
+    """Downsample each series of raw positions [start, stop) to at most `points` points with LTTB"""
+    requested = request.args.get('series')
+    names = requested.split(',') if requested else LTTB_SERIES
+    unknown = [name for name in names if name not in LTTB_SERIES]
+    if points < 0 or unknown:
+        return jsonify({"error": f"points must be >= 0 and series one of {', '.join(LTTB_SERIES)}"}), 400
+    
+    decimals = {column.name: column.decimals for column in history_store.schema}
+    # One read, so every series stays aligned with the timestamps while the sampler evicts
+    columns = history_store.export_columns(start, stop, ['timestamp', *names])
+    timestamps = columns['timestamp']
+    series = {}
+    for name in names:
+        values = columns[name]
+        selected = lttb_indices(timestamps, values, points)
+        places = decimals.get(name)
+        series[name] = {
+            "timestamps": timestamps[selected].tolist(),
+            "values": [round(value, places) if places is not None else value
+                       for value in values[selected].tolist()]
+        }
+    
+    return _json_bytes(dumps({
+        "count": len(timestamps),
+        "points": points,
+        "resolution": "raw",
+        "series": series
+    }))
 
 
 @app.route("/history/stats")
 def history_stats():
     """Get statistical summary of historical data"""
-    if not historical_data:
+    start_time = request.args.get('start_time', type=float)
+    end_time = request.args.get('end_time', type=float)
+    history = history_store
+    
+    if start_time or end_time:
+        # Vectorized aggregates over the requested window
+        start, stop = history.positions_between(start_time or None, end_time or None)
+        aggregates = history.aggregate(
+            ['timestamp', 'power_watts', 'utilization_percent', 'emissions_total_g'], start, stop
+        )
+    else:
+        # Running aggregates over the whole retained window, O(1)
+        aggregates = history.running_stats()
+    
+    timestamps = aggregates['timestamp']
+    if timestamps['count'] == 0:
         return jsonify({"error": "No historical data available"}), 404
     
-    # Calculate statistics
-    power_values = [d['gpu']['power_watts'] for d in historical_data]
-    emissions_values = [d['carbon']['emissions_total_g'] for d in historical_data]
-    utilization_values = [d['gpu']['utilization_percent'] for d in historical_data]
+    power = aggregates['power_watts']
+    emissions = aggregates['emissions_total_g']
+    utilization = aggregates['utilization_percent']
     
     stats = {
-        "total_records": len(historical_data),
+        "total_records": timestamps['count'],
         "time_range": {
-            "start": historical_data[0]['timestamp'],
-            "end": historical_data[-1]['timestamp'],
-            "duration_seconds": historical_data[-1]['timestamp'] - historical_data[0]['timestamp']
+            "start": timestamps['first'],
+            "end": timestamps['last'],
+            "duration_seconds": timestamps['last'] - timestamps['first']
         },
         "power": {
-            "min": min(power_values),
-            "max": max(power_values),
-            "avg": sum(power_values) / len(power_values)
+            "min": power['min'],
+            "max": power['max'],
+            "avg": power['avg'],
+            "stddev": power['stddev']
         },
         "emissions": {
-            "min": min(emissions_values),
-            "max": max(emissions_values),
-            "current": emissions_values[-1]
+            "min": emissions['min'],
+            "max": emissions['max'],
+            "current": emissions['last']
         },
         "utilization": {
-            "min": min(utilization_values),
-            "max": max(utilization_values),
-            "avg": sum(utilization_values) / len(utilization_values)
+            "min": utilization['min'],
+            "max": utilization['max'],
+            "avg": utilization['avg'],
+            "stddev": utilization['stddev']
         }
     }
     
     return jsonify(stats)
 
 
-@app.route("/export/sessions")
-def export_sessions():
-    """Export session data as CSV"""
-    # Create CSV in memory
+def _iter_csv_export(start, stop):
+    """Yield CSV text for history positions [start, stop), one chunk of rows at a time"""
     output = StringIO()
     writer = csv.writer(output)
     
@@ -216,9 +693,11 @@ def export_sessions():
         'Job Running'
     ])
     
-    # Write data rows
-    for record in historical_data:
-        writer.writerow([
+    # Write data rows (records evicted while streaming are skipped)
+    position = start
+    while position < stop:
+        chunk_end = min(position + EXPORT_CHUNK_ROWS, stop)
+        writer.writerows([
             datetime.fromtimestamp(record['timestamp']).isoformat(),
             record['gpu']['name'],
             record['gpu']['power_watts'],
@@ -229,17 +708,117 @@ def export_sessions():
             record['carbon']['emissions_total_g'],
             record['carbon']['region'],
             record['job']['running']
-        ])
+        ] for record in history_store.get_positions(position, chunk_end))
+        position = chunk_end
+        
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+    
+    # Header-only export when the window is empty
+    if output.tell():
+        yield output.getvalue()
+
+
+def _iter_column_chunks(start, stop, names=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield exported history columns for positions [start, stop), `chunk_rows` at a time"""
+    empty = True
+    for position in range(start, stop, chunk_rows):
+        columns = history_store.export_columns(position, min(position + chunk_rows, stop), names)
+        if len(columns['timestamp']):  # Chunks evicted while streaming are skipped
+            empty = False
+            yield columns
+    if empty:
+        yield history_store.export_columns(stop, stop, names)  # Columns without rows when the window is empty
+
+
+@app.route("/export/sessions")
+@_revalidated
+def export_sessions():
+    """
+    Stream session data (optionally gzipped and limited to a time window).
     
-    # Create response
-    output.seek(0)
+    CSV by default; `format=arrow|msgpack|parquet` (or the matching Accept
+    type) streams history columns in binary chunks, optionally only the
+    `columns` listed. Parquet can instead be written to EXPORT_DIR (`path=`).
+    """
+    start_time = request.args.get('start_time', type=float)
+    end_time = request.args.get('end_time', type=float)
+    use_gzip = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    
+    formats = {'csv': 'text/csv', 'arrow': ARROW_MIMETYPE, 'msgpack': MSGPACK_MIMETYPE, 'parquet': PARQUET_MIMETYPE}
+    requested = request.args.get('format')
+    if requested is not None and requested not in formats:
+        return jsonify({"error": f"format must be one of {', '.join(formats)}"}), 400
+    mimetype, error = _negotiate(
+        'text/csv', (ARROW_MIMETYPE, MSGPACK_MIMETYPE, PARQUET_MIMETYPE), formats.get(requested)
+    )
+    if error:
+        return error
+    
+    names = None
+    if request.args.get('columns'):
+        available = [column.name for column in history_store.schema + history_store.device_schema]
+        names = request.args['columns'].split(',')
+        unknown = [name for name in names if name not in available]
+        if unknown or mimetype == 'text/csv':
+            return jsonify({
+                "error": f"columns applies to arrow, msgpack and parquet exports and must be among {', '.join(available)}"
+            }), 400
+        names = ['timestamp'] + [name for name in names if name != 'timestamp']
+    
+    # Fix the window up front so rows sampled during the export are excluded
+    start, stop = history_store.positions_between(start_time or None, end_time or None)
+    
+    if request.args.get('path'):
+        return _export_parquet_file(request.args['path'], mimetype, start, stop, names)
+    
+    if mimetype == ARROW_MIMETYPE:
+        chunks, extension = iter_arrow_stream(_iter_column_chunks(start, stop, names)), 'arrows'
+    elif mimetype == MSGPACK_MIMETYPE:
+        chunks, extension = iter_msgpack_stream(_iter_column_chunks(start, stop, names)), 'msgpack'
+    elif mimetype == PARQUET_MIMETYPE:
+        # Parquet compresses each row group itself, so row groups are large and gzip is skipped
+        chunks = iter_parquet(_iter_column_chunks(start, stop, names, PARQUET_ROW_GROUP_ROWS), PARQUET_COMPRESSION)
+        extension, use_gzip = 'parquet', False
+    else:
+        chunks, extension = _iter_csv_export(start, stop), 'csv'
+    
+    filename = f'ecocompute-export-{int(time.time())}.{extension}'
+    if use_gzip:
+        return Response(
+            compress_stream(chunks, 'gzip', gzip_level=GZIP_LEVEL),
+            mimetype='application/gzip',
+            headers={'Content-Disposition': f'attachment; filename={filename}.gz'}
+        )
     return Response(
-        output.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': f'attachment; filename=ecocompute-export-{int(time.time())}.csv'}
+        chunks,
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
 
+def _export_parquet_file(filename, mimetype, start, stop, names):
+    """Write a Parquet export of positions [start, stop) to EXPORT_DIR/filename"""
+    if mimetype != PARQUET_MIMETYPE:
+        return jsonify({"error": "path= is only supported for parquet exports"}), 400
+    if not EXPORT_DIR:
+        return jsonify({"error": "Writing exports on the server is disabled (set EXPORT_DIR)"}), 403
+    if os.path.basename(filename) != filename or filename.startswith('.'):
+        return jsonify({"error": "path must be a plain file name inside EXPORT_DIR"}), 400
+    
+    path = os.path.join(EXPORT_DIR, filename)
+    rows = write_parquet(
+        _iter_column_chunks(start, stop, names, PARQUET_ROW_GROUP_ROWS), path, PARQUET_COMPRESSION
+    )
+    return jsonify({
+        "status": "written",
+        "path": path,
+        "rows": rows,
+        "bytes": os.path.getsize(path)
+    })
+
+
 @app.route("/region/<region_code>", methods=["POST"])
 def update_region(region_code):
     """Update the carbon intensity region"""
@@ -258,9 +837,8 @@ def update_region(region_code):
     
     zone = region_map.get(region_code, "US-CAL-CISO")
     
-    # Clear cache to force new fetch
-    carbon_calc.cached_intensity = None
-    carbon_calc.cache_time = 0
+    # Keep the cache: a cold zone is fetched in the background, off the sampler thread
+    sampler.set_zone(zone)
     
     return jsonify({
         "status": "success",
@@ -276,8 +854,10 @@ def main():
     print("  🌱 EcoCompute AI / GreenGL")
     print("  GPU Power & Carbon Emissions Monitor")
     print("="*60)
-    print(f"\n  GPU Mode: {'Simulated' if gpu_monitor.simulated else 'Real NVML'}")
+    print(f"\n  GPU Mode: {'Simulated' if gpu_monitor.simulated else 'Real NVML'} ({gpu_monitor.device_count} device(s))")
     print(f"  Carbon API: {'API Key Set' if CARBON_API_KEY else 'Mocked Values'}")
+    print(f"  Sample Rate: {SAMPLE_RATE_HZ:g} Hz")
+    print(f"  History: {HISTORY_DB_PATH or 'In-memory'}")
     print(f"\n  Dashboard: http://localhost:5000")
     print(f"  Metrics API: http://localhost:5000/metrics")
     print("\n" + "="*60 + "\n")
@@ -285,6 +865,9 @@ def main():
     try:
         app.run(host="0.0.0.0", port=5000, debug=False, threaded=True)
     finally:
+        sampler.stop()
+        if history_db is not None:
+            history_db.close()
         gpu_monitor.shutdown()
 
 
@@ -0,0 +1,105 @@
+"""
+Metrics Broadcast - EcoCompute AI / GreenGL
+Fan-out of sampler ticks to live subscribers (Server-Sent Events)
+"""
+
+import threading
+from collections import deque
+from typing import Iterator, List, Optional
+
+DEFAULT_CLIENT_BUFFER = 16  # Events queued per subscriber before the oldest are dropped
+DEFAULT_KEEPALIVE = 15.0  # Seconds of silence before a comment line keeps proxies from timing out
+
+
+def format_event(payload: bytes, event_id: Optional[int] = None) -> bytes:
+    """Wrap an encoded JSON payload as one SSE `data:` event"""
+    prefix = f"id: {event_id}\n".encode("ascii") if event_id is not None else b""
+    return prefix + b"data: " + payload + b"\n\n"
+
+
+class Subscription:
+    """One client's bounded event queue; a slow client loses its oldest events"""
+
+    def __init__(self, buffer_size: int = DEFAULT_CLIENT_BUFFER):
+        self._events: deque = deque(maxlen=buffer_size)
+        self._ready = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def push(self, event: bytes):
+        with self._ready:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            self._ready.notify()
+
+    def pop_all(self, timeout: float) -> List[bytes]:
+        """Wait up to `timeout` seconds for events and take all that are queued"""
+        with self._ready:
+            if not self._events and not self.closed:
+                self._ready.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+    def close(self):
+        with self._ready:
+            self.closed = True
+            self._ready.notify()
+
+
+class MetricsBroadcaster:
+    """
+    Publishes each sample to every subscriber.
+
+    Each tick's snapshot arrives already serialized and the same bytes are
+    queued for all clients, so N viewers cost N queue appends.
+    """
+
+    def __init__(self, buffer_size: int = DEFAULT_CLIENT_BUFFER, keepalive: float = DEFAULT_KEEPALIVE):
+        self.buffer_size = buffer_size
+        self.keepalive = keepalive
+        self._subscribers: List[Subscription] = []
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self.buffer_size)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscription.close()
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def publish(self, payload: bytes, event_id: Optional[int] = None):
+        """Queue an encoded snapshot for every subscriber"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+        event = format_event(payload, event_id)
+        for subscription in subscribers:
+            subscription.push(event)
+
+    def stream(self, initial: Optional[bytes] = None) -> Iterator[bytes]:
+        """Yield SSE bytes for one client until it disconnects (generator close)"""
+        subscription = self.subscribe()
+        try:
+            if initial is not None:
+                yield initial
+            while not subscription.closed:
+                events = subscription.pop_all(self.keepalive)
+                if events:
+                    yield b"".join(events)
+                else:
+                    yield b": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscription)
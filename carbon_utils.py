@@ -4,10 +4,18 @@ Carbon intensity fetching, emissions calculation, and suggestions
 """
 
 import time
+import queue
 import random
-from dataclasses import dataclass
-from typing import Optional
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional
 import requests
+from requests.adapters import HTTPAdapter
+from energy import EnergyMeter
+from jobs import JobLedger, JobTracker
+from urllib3.util.retry import Retry
 
 
 @dataclass
@@ -19,12 +27,31 @@ class CarbonData:
     emissions_grams_per_second: float
     emissions_grams_total: float
     suggestion: str
+    is_stale: bool = False
+
+
+@dataclass
+class IntensityReading:
+    """Carbon intensity of one zone as fetched (or mocked) at a point in time"""
+    intensity: float
+    is_mocked: bool
+    region: str
+    fetched_at: float
+    is_stale: bool = False  # Served past its TTL while a refresh is pending
 
 
 # Configuration
 CARBON_INTENSITY_THRESHOLD = 400  # gCO2/kWh - above this is considered "high"
 DEFAULT_MOCK_INTENSITY = 650  # Default mocked value
 ELECTRICITY_MAPS_API_URL = "https://api.electricitymap.org/v3/carbon-intensity/latest"
+DEFAULT_CACHE_TTL = 300  # Seconds a zone's intensity stays fresh (5 minutes)
+DEFAULT_CACHE_SIZE = 32  # Zones kept before least-recently-used ones are evicted
+DEFAULT_MAX_STALENESS = 3600  # Oldest value (seconds) served while refreshing in the background
+DEFAULT_REFRESH_RETRY = 60  # Seconds before retrying a zone whose refresh failed
+DEFAULT_POOL_SIZE = 10  # Keep-alive connections kept per host
+DEFAULT_MAX_RETRIES = 2  # Retries for connection errors and 429/5xx responses
+DEFAULT_RETRY_BACKOFF = 0.5  # Seconds; doubles on each retry
+API_TIMEOUT = 5  # Seconds per upstream request
 
 # Region-specific mocked carbon intensities (gCO2/kWh) when API is unavailable
 REGION_MOCK_INTENSITIES = {
@@ -40,74 +67,311 @@ REGION_MOCK_INTENSITIES = {
 }
 
 
+def create_session(
+    pool_size: int = DEFAULT_POOL_SIZE,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff_factor: float = DEFAULT_RETRY_BACKOFF
+) -> requests.Session:
+    """Create an HTTP session with a keep-alive connection pool and retry/backoff policy"""
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class IntensityCache:
+    """Per-zone carbon intensity cache with TTL expiry and LRU eviction"""
+    
+    def __init__(self, ttl: float = DEFAULT_CACHE_TTL, max_size: int = DEFAULT_CACHE_SIZE):
+        if max_size <= 0:
+            raise ValueError("Cache size must be positive")
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, IntensityReading]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, zone: str, max_staleness: float = 0.0) -> Optional[IntensityReading]:
+        """
+        Get a zone's reading, or None on a miss. Readings past the TTL but
+        younger than max_staleness are returned flagged as stale.
+        """
+        with self._lock:
+            reading = self._entries.get(zone)
+            age = time.time() - reading.fetched_at if reading else None
+            if reading is None or (age >= self.ttl and age >= max_staleness):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(zone)
+            if age >= self.ttl:
+                self.stale_hits += 1
+                return replace(reading, is_stale=True)
+            self.hits += 1
+            return reading
+    
+    def peek(self, zone: str) -> Optional[IntensityReading]:
+        """Get the cached reading for a zone regardless of age, without counting a lookup"""
+        with self._lock:
+            return self._entries.get(zone)
+    
+    def readings(self) -> Dict[str, IntensityReading]:
+        """Copy of every cached zone's reading"""
+        with self._lock:
+            return dict(self._entries)
+    
+    def put(self, zone: str, reading: IntensityReading):
+        """Store a reading, evicting the least recently used zone when full"""
+        with self._lock:
+            self._entries[zone] = reading
+            self._entries.move_to_end(zone)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, zone: Optional[str] = None):
+        """Drop one zone, or every zone when none is given"""
+        with self._lock:
+            if zone is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(zone, None)
+    
+    def stats(self) -> dict:
+        """Hit/miss counters and occupancy"""
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "zones": list(self._entries.keys())
+            }
+
+
 class CarbonCalculator:
     """Calculate carbon emissions and provide suggestions"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        cache_ttl: float = DEFAULT_CACHE_TTL,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        max_staleness: float = DEFAULT_MAX_STALENESS,
+        session: Optional[requests.Session] = None,
+        api_url: str = ELECTRICITY_MAPS_API_URL,
+        integration_method: str = "trapezoid",
+        refresh_retry: float = DEFAULT_REFRESH_RETRY
+    ):
         self.api_key = api_key
-        self.cached_intensity: Optional[float] = None
-        self.cache_time: float = 0
-        self.cache_duration: float = 300  # 5 minutes cache
-        self.job_start_time: Optional[float] = None
-        self.total_energy_wh: float = 0.0
-        self.last_update_time: float = time.time()
+        # Shared pooled session; pass your own (or api_url) to point at a stand-in server
+        self.session = session if session is not None else create_session()
+        self.api_url = api_url
+        self.cache = IntensityCache(ttl=cache_ttl, max_size=cache_size)
+        self.max_staleness = max_staleness
+        self.refresh_retry = refresh_retry
+        self._refresh_queue: "queue.Queue[str]" = queue.Queue()
+        self._refreshing = set()  # Zones queued or being refreshed
+        self._retry_at: Dict[str, float] = {}  # Zone -> earliest retry after a failed refresh
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._inflight: Dict[str, Future] = {}  # Zone -> upstream fetch other callers wait on
+        self._inflight_lock = threading.Lock()
+        # Energy is measured continuously per channel (node total + each GPU)
+        # and credited to every running job in one pass per sample
+        self.integration_method = integration_method
+        self.node_meter = EnergyMeter(integration_method)
+        self.device_meters: Dict[int, EnergyMeter] = {}
+        self.jobs = JobTracker()
+        self.total_emissions_g = 0.0  # Node emissions since startup (all samples, not just jobs)
+        # Guards the meters and keeps "measure, then read the job totals" atomic
+        # when request threads and the sampler call in concurrently
+        self._lock = threading.RLock()
         self.is_mocked = True
         self.region = "Unknown"
     
-    def start_job(self):
-        """Mark the start of a job for emissions tracking"""
-        self.job_start_time = time.time()
-        self.total_energy_wh = 0.0
-        self.last_update_time = time.time()
+    def start_job(
+        self,
+        gpu_index: Optional[int] = None,
+        pid: Optional[int] = None,
+        name: Optional[str] = None
+    ) -> JobLedger:
+        """Start tracking a job, optionally bound to one GPU index or a process ID"""
+        return self.jobs.start(gpu_index=gpu_index, pid=pid, name=name)
     
-    def stop_job(self):
-        """Mark the end of a job"""
-        self.job_start_time = None
+    def stop_job(self, job_id: Optional[str] = None) -> Optional[JobLedger]:
+        """Stop a job by ID, or the most recently started running job"""
+        if job_id is None:
+            job = self.jobs.current()
+            return self.jobs.stop(job.job_id) if job else None
+        return self.jobs.stop(job_id)
     
     def is_job_running(self) -> bool:
-        """Check if a job is currently being tracked"""
-        return self.job_start_time is not None
+        """Check if any job is currently being tracked"""
+        return self.jobs.current() is not None
     
     def get_runtime_hours(self) -> float:
         """Get the runtime of the current job in hours"""
-        if self.job_start_time is None:
+        job = self.jobs.current()
+        if job is None:
             return 0.0
-        return (time.time() - self.job_start_time) / 3600.0
+        return job.runtime_seconds() / 3600.0
+    
+    @property
+    def total_energy_wh(self) -> float:
+        """Energy of the current job"""
+        job = self.jobs.current()
+        return job.energy_wh if job else 0.0
     
     def fetch_carbon_intensity(self, zone: str = "US-CAL-CISO") -> float:
         """
         Fetch real-time carbon intensity from Electricity Maps API.
         Falls back to mocked value if API fails.
         """
-        # Check cache first (but only if same zone)
-        if self.cached_intensity and (time.time() - self.cache_time) < self.cache_duration and self.region == zone:
-            return self.cached_intensity
+        return self.get_reading(zone).intensity
+    
+    def get_reading(self, zone: str = "US-CAL-CISO", wait: bool = True) -> IntensityReading:
+        """
+        Get a zone's intensity reading, calling upstream at most once per cache TTL.
         
+        Expired readings younger than max_staleness are served immediately
+        (flagged is_stale) while a background worker refreshes them; only a
+        cold or too-stale zone blocks on the upstream call, and concurrent
+        callers for that zone share a single fetch. Pass wait=False where the
+        caller must never block (the sampler): such a zone then serves its last
+        reading, or a mocked one, flagged is_stale until the refresh lands.
+        After a failed refresh the last real reading is kept (flagged is_stale)
+        and the zone is not retried for refresh_retry seconds.
+        """
+        # Check cache first (keyed per zone)
+        reading = self.cache.get(zone, max_staleness=self.max_staleness)
+        if reading is None and wait and not self._retry_pending(zone):
+            reading = self._fetch_shared(zone)
+        elif reading is None:
+            reading = replace(self.cache.peek(zone) or self._mock_reading(zone), is_stale=True)
+            self._schedule_refresh(zone)
+        elif reading.is_stale:
+            self._schedule_refresh(zone)
+        
+        with self._lock:
+            self.is_mocked = reading.is_mocked
+            self.region = reading.region
+        return reading
+    
+    def _retry_pending(self, zone: str) -> bool:
+        """Whether a zone's last refresh failed less than refresh_retry seconds ago"""
+        with self._refresh_lock:
+            return time.time() < self._retry_at.get(zone, 0.0)
+    
+    def _schedule_refresh(self, zone: str):
+        """Queue a background refresh for a zone unless one is pending or backing off"""
+        with self._refresh_lock:
+            if zone in self._refreshing or time.time() < self._retry_at.get(zone, 0.0):
+                return
+            self._refreshing.add(zone)
+            if self._refresh_thread is None or not self._refresh_thread.is_alive():
+                self._refresh_thread = threading.Thread(
+                    target=self._refresh_worker, name="carbon-refresh", daemon=True
+                )
+                self._refresh_thread.start()
+        self._refresh_queue.put(zone)
+    
+    def _fetch_shared(self, zone: str) -> IntensityReading:
+        """
+        Fetch a zone and cache the result. Only one fetch per zone runs at a
+        time; callers arriving while it is in flight wait for its reading.
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(zone)
+            owner = future is None
+            if owner:
+                future = self._inflight[zone] = Future()
+        if not owner:
+            return future.result()
+        try:
+            # A fetch may have finished between our cache miss and taking ownership
+            reading = self.cache.peek(zone)
+            if reading is None or time.time() - reading.fetched_at >= self.cache.ttl:
+                reading = self._store_fetched(zone, reading, self._fetch_reading(zone))
+            future.set_result(reading)
+            return reading
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(zone, None)
+    
+    def _store_fetched(
+        self,
+        zone: str,
+        previous: Optional[IntensityReading],
+        fetched: IntensityReading
+    ) -> IntensityReading:
+        """
+        Cache a fetched reading. A failed fetch (mocked) never replaces a real
+        reading: that one is served stale and the zone retried later.
+        """
+        if fetched.is_mocked and previous is not None and not previous.is_mocked:
+            with self._refresh_lock:
+                self._retry_at[zone] = time.time() + self.refresh_retry
+            return replace(previous, is_stale=True)
+        with self._refresh_lock:
+            self._retry_at.pop(zone, None)
+        self.cache.put(zone, fetched)
+        return fetched
+    
+    def _refresh_worker(self):
+        """Refresh queued zones one at a time"""
+        while True:
+            zone = self._refresh_queue.get()
+            try:
+                self._fetch_shared(zone)
+            except Exception as e:
+                print(f"⚠ Carbon refresh error ({zone}): {e}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(zone)
+    
+    def _fetch_reading(self, zone: str) -> IntensityReading:
+        """Fetch a zone's intensity from the API, or mock it"""
         # Try to fetch from API
         if self.api_key:
             try:
                 headers = {"auth-token": self.api_key}
                 params = {"zone": zone}
-                response = requests.get(
-                    ELECTRICITY_MAPS_API_URL,
+                response = self.session.get(
+                    self.api_url,
                     headers=headers,
                     params=params,
-                    timeout=5
+                    timeout=API_TIMEOUT
                 )
                 if response.status_code == 200:
                     data = response.json()
                     intensity = data.get("carbonIntensity", DEFAULT_MOCK_INTENSITY)
-                    self.cached_intensity = intensity
-                    self.cache_time = time.time()
-                    self.is_mocked = False
-                    self.region = zone
-                    return intensity
+                    return IntensityReading(intensity, False, zone, time.time())
             except Exception as e:
                 print(f"⚠ Carbon API error: {e}")
         
-        # Fall back to mocked value with regional variation
-        self.is_mocked = True
-        
+        return self._mock_reading(zone)
+    
+    def _mock_reading(self, zone: str) -> IntensityReading:
+        """Mocked intensity with regional variation"""
         # Get region-specific base intensity or use default
         base_intensity = REGION_MOCK_INTENSITIES.get(zone, DEFAULT_MOCK_INTENSITY)
         
@@ -116,52 +380,117 @@ class CarbonCalculator:
         variation = random.uniform(-50, 50) * time_factor
         mocked_value = max(50, base_intensity + variation)
         
-        self.cached_intensity = mocked_value
-        self.cache_time = time.time()
-        self.region = f"Mocked ({zone})"
+        return IntensityReading(mocked_value, True, f"Mocked ({zone})", time.time())
+    
+    def update_energy_consumption(
+        self,
+        power_watts: float,
+        energy_mj: Optional[float] = None,
+        devices: Optional[List] = None,
+        carbon_intensity: float = 0.0
+    ):
+        """
+        Measure the energy drawn since the previous sample and credit it to jobs.
         
-        return mocked_value
+        The node total and each GPU in `devices` (GPUMetrics) have their own
+        EnergyMeter: the cumulative hardware counter (energy_mj) gives exact
+        deltas regardless of how often this is called, otherwise sampled power
+        is integrated. Every running job then takes its GPU's (or the node's)
+        interval in a single pass, priced at carbon_intensity.
+        """
+        with self._lock:
+            current_time = time.time()
+            node_interval = self.node_meter.update(current_time, power_watts, energy_mj)
+            device_intervals = {}
+            for device in devices or []:
+                meter = self.device_meters.get(device.index)
+                if meter is None:
+                    meter = self.device_meters[device.index] = EnergyMeter(self.integration_method)
+                device_intervals[device.index] = meter.update(current_time, device.power_watts, device.energy_mj)
+            if node_interval is not None:
+                self.total_emissions_g += node_interval.energy_wh / 1000 * carbon_intensity
+            self.jobs.record(node_interval, device_intervals, carbon_intensity)
     
-    def update_energy_consumption(self, power_watts: float):
-        """Update total energy consumption based on current power draw"""
-        current_time = time.time()
-        if self.job_start_time is not None:
-            time_delta_hours = (current_time - self.last_update_time) / 3600.0
-            energy_wh = power_watts * time_delta_hours
-            self.total_energy_wh += energy_wh
-        self.last_update_time = current_time
+    def energy_report(self, job: Optional[JobLedger] = None) -> dict:
+        """
+        Energy of a job (default: the current one) with its accuracy:
+        error_estimate_wh bounds the integration error of the reported value
+        (0 for counter-measured energy), and drift_wh is integrated minus
+        counter energy over the intervals where both were available.
+        """
+        with self._lock:
+            job = job or self.jobs.current()
+            if job is None:
+                return {
+                    "energy_wh": 0.0,
+                    "emissions_g": 0.0,
+                    "source": "counter" if self.node_meter.last_energy_mj is not None else "integrated",
+                    "method": self.integration_method,
+                    "error_estimate_wh": 0.0,
+                    "drift_wh": None
+                }
+            return {
+                "energy_wh": job.energy_wh,
+                "emissions_g": job.emissions_g,
+                "source": job.energy_source,
+                "method": self.integration_method,
+                "error_estimate_wh": job.error_wh,
+                "drift_wh": job.drift_wh if job.counter_wh > 0 else None
+            }
     
-    def calculate_emissions(self, power_watts: float, carbon_intensity: float) -> CarbonData:
+    def calculate_emissions(
+        self,
+        power_watts: float,
+        carbon_intensity: float,
+        update_energy: bool = True,
+        reading: Optional[IntensityReading] = None,
+        energy_mj: Optional[float] = None,
+        devices: Optional[List] = None
+    ) -> CarbonData:
         """
         Calculate carbon emissions using the formula:
         carbon_grams = (power_watts / 1000) * carbon_intensity * runtime_hours
+
+        Pass update_energy=False to evaluate a reading without integrating it
+        into the job's energy total (e.g. when re-pricing a sample for another zone).
+        Pass the zone's reading to label the result with its region and source
+        instead of those of the most recent fetch, the node's cumulative energy
+        counter (energy_mj) to measure energy from the hardware, and per-device
+        readings (devices) to account jobs bound to a single GPU.
         """
-        self.update_energy_consumption(power_watts)
-        
         # Calculate emissions rate (per second for real-time display)
         # power_watts / 1000 = kW
         # carbon_intensity is in gCO2/kWh
         # Divide by 3600 to get per-second rate
         emissions_per_second = (power_watts / 1000) * carbon_intensity / 3600
         
-        # Calculate total emissions for the job
-        runtime_hours = self.get_runtime_hours()
-        if runtime_hours > 0:
-            # Use integrated energy for more accurate calculation
-            total_emissions = (self.total_energy_wh / 1000) * carbon_intensity
-        else:
-            total_emissions = 0.0
+        with self._lock:
+            if update_energy:
+                self.update_energy_consumption(power_watts, energy_mj, devices, carbon_intensity)
+            
+            # Calculate total emissions for the current job
+            job = self.jobs.current()
+            if job is None:
+                total_emissions = 0.0
+            elif update_energy:
+                # Each interval was priced at the intensity in effect when it was drawn
+                total_emissions = job.emissions_g
+            else:
+                # Re-pricing for another zone: apply its intensity to the whole job
+                total_emissions = (job.energy_wh / 1000) * carbon_intensity
+            is_mocked, region = self.is_mocked, self.region
         
         # Generate suggestion
         suggestion = self.get_suggestion(carbon_intensity)
         
         return CarbonData(
             carbon_intensity_g_per_kwh=carbon_intensity,
-            is_mocked=self.is_mocked,
-            region=self.region,
+            is_mocked=reading.is_mocked if reading else is_mocked,
+            region=reading.region if reading else region,
             emissions_grams_per_second=emissions_per_second,
             emissions_grams_total=total_emissions,
-            suggestion=suggestion
+            suggestion=suggestion,
+            is_stale=reading.is_stale if reading else False
         )
     
     def get_suggestion(self, carbon_intensity: float) -> str:
@@ -178,9 +507,25 @@ class CarbonCalculator:
 _calculator: Optional[CarbonCalculator] = None
 
 
-def get_calculator(api_key: Optional[str] = None) -> CarbonCalculator:
+def get_calculator(
+    api_key: Optional[str] = None,
+    cache_ttl: float = DEFAULT_CACHE_TTL,
+    cache_size: int = DEFAULT_CACHE_SIZE,
+    max_staleness: float = DEFAULT_MAX_STALENESS,
+    session: Optional[requests.Session] = None,
+    api_url: str = ELECTRICITY_MAPS_API_URL,
+    integration_method: str = "trapezoid"
+) -> CarbonCalculator:
     """Get or create the global carbon calculator instance"""
     global _calculator
     if _calculator is None:
-        _calculator = CarbonCalculator(api_key)
+        _calculator = CarbonCalculator(
+            api_key,
+            cache_ttl=cache_ttl,
+            cache_size=cache_size,
+            max_staleness=max_staleness,
+            session=session,
+            api_url=api_url,
+            integration_method=integration_method
+        )
     return _calculator
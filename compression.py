@@ -0,0 +1,67 @@
+"""
+Response Compression - EcoCompute AI / GreenGL
+gzip / brotli content encoding for whole and streamed response bodies
+"""
+
+import zlib
+from typing import Iterable, Iterator, List, Optional, Union
+
+# Try to import brotli (optional, smaller than gzip for JSON), fall back to gzip only
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+DEFAULT_MIN_SIZE = 1024  # Bodies smaller than this (bytes) are sent uncompressed
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_BROTLI_QUALITY = 5  # Higher qualities compress little better but much slower
+
+
+def supported_encodings() -> List[str]:
+    """Content codings this server can produce, most preferred first"""
+    return ["br", "gzip"] if BROTLI_AVAILABLE else ["gzip"]
+
+
+class Encoder:
+    """Incremental compressor for one content coding"""
+
+    def __init__(self, encoding: str, gzip_level: int = DEFAULT_GZIP_LEVEL, brotli_quality: int = DEFAULT_BROTLI_QUALITY):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        elif encoding == "gzip":
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+        else:
+            raise ValueError(f"Unsupported content encoding '{encoding}'")
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def compress(body: bytes, encoding: str, **options) -> bytes:
+    """Compress a whole body"""
+    encoder = Encoder(encoding, **options)
+    return encoder.compress(body) + encoder.finish()
+
+
+def compress_stream(chunks: Iterable[Union[str, bytes]], encoding: str, **options) -> Iterator[bytes]:
+    """Compress a stream of text or byte chunks on the fly"""
+    encoder = Encoder(encoding, **options)
+    for chunk in chunks:
+        data = encoder.compress(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+def choose_encoding(accept_encodings) -> Optional[str]:
+    """Preferred supported coding for a request's Accept-Encoding (werkzeug Accept), or None"""
+    return accept_encodings.best_match(supported_encodings())
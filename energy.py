@@ -0,0 +1,204 @@
+"""
+Energy Integration - EcoCompute AI / GreenGL
+Numerical integration of sampled power into energy, with error estimates
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Type
+
+
+class EnergyIntegrator:
+    """
+    Base integrator: accumulates energy (Wh) from (timestamp, power) samples.
+
+    Subclasses implement _integrate() for the newest interval and may refine
+    earlier intervals. `error_estimate_wh` is an a posteriori estimate of the
+    discretization error based on the curvature of the sampled power.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, timestamp: Optional[float] = None, power_watts: Optional[float] = None):
+        """Drop accumulated energy, optionally seeding the first sample"""
+        self.energy_wh = 0.0
+        self.error_estimate_wh = 0.0
+        self.samples = 0
+        self._times = []  # Recent samples needed for the next step
+        self._powers = []
+        if timestamp is not None and power_watts is not None:
+            self.add(timestamp, power_watts)
+
+    def add(self, timestamp: float, power_watts: float) -> float:
+        """Add a sample; returns the energy (Wh) added by it"""
+        if self._times and timestamp <= self._times[-1]:
+            return 0.0  # Ignore duplicate or out-of-order samples
+        self._times.append(timestamp)
+        self._powers.append(power_watts)
+        self.samples += 1
+        before = self.energy_wh
+        if len(self._times) > 1:
+            self._integrate()
+        # Keep the three most recent samples (enough for curvature and Simpson pairs)
+        del self._times[:-3], self._powers[:-3]
+        return self.energy_wh - before
+
+    def _integrate(self):
+        raise NotImplementedError
+
+    def _curvature_error(self) -> float:
+        """
+        Trapezoid error estimate (Wh) for the newest interval: h^3/12 * |P''|,
+        with P'' taken from the second difference of the last three samples.
+        """
+        if len(self._times) < 3:
+            return 0.0
+        (t0, t1, t2), (p0, p1, p2) = self._times[-3:], self._powers[-3:]
+        h0, h1 = t1 - t0, t2 - t1
+        second_derivative = 2 * ((p2 - p1) / h1 - (p1 - p0) / h0) / (h0 + h1)
+        return h1 ** 3 / 12 * abs(second_derivative) / 3600.0
+
+
+class RectangleIntegrator(EnergyIntegrator):
+    """Rectangle rule using the newest reading for the whole interval (legacy behaviour)"""
+
+    name = "rectangle"
+
+    def _integrate(self):
+        (t0, t1), (p0, p1) = self._times[-2:], self._powers[-2:]
+        self.energy_wh += p1 * (t1 - t0) / 3600.0
+        # Error of a one-sided rule is first order: half the change over the interval
+        self.error_estimate_wh += abs(p1 - p0) * (t1 - t0) / 2 / 3600.0
+
+
+class TrapezoidIntegrator(EnergyIntegrator):
+    """Trapezoid rule; unbiased during linear ramps"""
+
+    name = "trapezoid"
+
+    def _integrate(self):
+        (t0, t1), (p0, p1) = self._times[-2:], self._powers[-2:]
+        self.energy_wh += (p0 + p1) / 2 * (t1 - t0) / 3600.0
+        self.error_estimate_wh += self._curvature_error()
+
+
+class SimpsonIntegrator(EnergyIntegrator):
+    """
+    Composite Simpson's rule over pairs of uniform intervals.
+
+    The newest unpaired interval is counted with the trapezoid rule and
+    replaced once its partner arrives. Pairs whose intervals differ by more
+    than `uniform_tolerance` (e.g. a late sampler tick) stay trapezoidal.
+    """
+
+    name = "simpson"
+    uniform_tolerance = 0.1
+
+    def reset(self, timestamp: Optional[float] = None, power_watts: Optional[float] = None):
+        self._pair_open = False  # Whether the newest interval still awaits its partner
+        self._pending_wh = 0.0  # Trapezoid energy of the unpaired interval
+        self._pending_error_wh = 0.0
+        super().reset(timestamp, power_watts)
+
+    def _integrate(self):
+        (t1, t2), (p1, p2) = self._times[-2:], self._powers[-2:]
+        trapezoid = (p1 + p2) / 2 * (t2 - t1) / 3600.0
+
+        if not self._pair_open:
+            # Start a new pair
+            self._pair_open = True
+            self._pending_wh = trapezoid
+            self._pending_error_wh = self._curvature_error()
+            self.energy_wh += trapezoid
+            self.error_estimate_wh += self._pending_error_wh
+            return
+
+        t0, p0 = self._times[-3], self._powers[-3]
+        h0, h1 = t1 - t0, t2 - t1
+        pair_trapezoid = self._pending_wh + trapezoid
+        if abs(h1 - h0) <= self.uniform_tolerance * max(h0, h1):
+            simpson = (h0 + h1) / 6 * (p0 + 4 * p1 + p2) / 3600.0
+            # The Simpson/trapezoid gap is a conservative bound (it estimates the trapezoid's error)
+            error = abs(simpson - pair_trapezoid)
+        else:
+            simpson = pair_trapezoid
+            error = self._pending_error_wh + self._curvature_error()
+        self.energy_wh += simpson - self._pending_wh
+        self.error_estimate_wh += error - self._pending_error_wh
+        self._pair_open = False
+
+
+INTEGRATORS: Dict[str, Type[EnergyIntegrator]] = {
+    RectangleIntegrator.name: RectangleIntegrator,
+    TrapezoidIntegrator.name: TrapezoidIntegrator,
+    SimpsonIntegrator.name: SimpsonIntegrator,
+}
+
+
+def make_integrator(name: str = "trapezoid") -> EnergyIntegrator:
+    """Create an integrator by name ("rectangle", "trapezoid" or "simpson")"""
+    try:
+        return INTEGRATORS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown integration method '{name}' (choose from {', '.join(INTEGRATORS)})")
+
+
+@dataclass
+class IntervalEnergy:
+    """Energy drawn between two consecutive samples"""
+    start_time: float
+    end_time: float
+    energy_wh: float  # Best estimate: counter delta when available, else integrated
+    integrated_wh: float
+    counter_wh: Optional[float]  # Hardware counter delta, if both samples had one
+    error_wh: float  # Integration error estimate (0 when the counter is used)
+
+
+class EnergyMeter:
+    """
+    Continuous energy measurement for one power channel (a GPU or the node).
+
+    Each update returns the energy of the interval since the previous one,
+    from the hardware counter when both ends have a reading and from the
+    integrator otherwise, so any number of jobs can share one measurement.
+    """
+
+    def __init__(self, method: str = "trapezoid"):
+        self.integrator = make_integrator(method)
+        self.last_time: Optional[float] = None
+        self.last_energy_mj: Optional[float] = None
+        self.total_wh = 0.0  # Energy of every interval measured so far
+
+    def update(
+        self,
+        timestamp: float,
+        power_watts: float,
+        energy_mj: Optional[float] = None
+    ) -> Optional[IntervalEnergy]:
+        """Add a sample; returns the energy since the previous sample (None for the first)"""
+        if self.last_time is not None and timestamp <= self.last_time:
+            return None
+        error_before = self.integrator.error_estimate_wh
+        integrated_wh = self.integrator.add(timestamp, power_watts)
+        error_wh = self.integrator.error_estimate_wh - error_before
+
+        counter_wh = None
+        if energy_mj is not None and self.last_energy_mj is not None and energy_mj >= self.last_energy_mj:
+            counter_wh = (energy_mj - self.last_energy_mj) / 3.6e6  # mJ -> Wh
+        # A missing reading or counter reset breaks the chain instead of spanning the gap
+        self.last_energy_mj = energy_mj
+
+        start_time, self.last_time = self.last_time, timestamp
+        if start_time is None:
+            return None
+        self.total_wh += counter_wh if counter_wh is not None else integrated_wh
+        return IntervalEnergy(
+            start_time=start_time,
+            end_time=timestamp,
+            energy_wh=counter_wh if counter_wh is not None else integrated_wh,
+            integrated_wh=integrated_wh,
+            counter_wh=counter_wh,
+            error_wh=0.0 if counter_wh is not None else error_wh
+        )
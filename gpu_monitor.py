@@ -3,11 +3,12 @@ GPU Monitor Module - EcoCompute AI / GreenGL
 Handles GPU telemetry via NVML with automatic fallback to simulation
 """
 
+import threading
 import time
 import math
 import random
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, List, Optional
 
 # Try to import nvidia-ml-py (imported as pynvml), set flag if unavailable
 try:
@@ -27,14 +28,75 @@ class GPUMetrics:
     utilization_percent: float
     gpu_name: str
     is_simulated: bool
+    index: int = 0  # NVML device index
+    device_count: int = 1  # Devices summarized by this reading (node totals)
+    energy_mj: Optional[float] = None  # Cumulative energy counter in millijoules, if supported
+
+
+@dataclass(frozen=True)
+class DeviceInfo:
+    """Static device properties, queried once at initialization"""
+    index: int
+    name: str
+    uuid: str
+    memory_total_mb: float
+    power_limit_watts: Optional[float]
+    pci_bus_id: str
+    energy_counter_supported: bool
+    
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _decode(value: Any) -> Any:
+    """NVML returns bytes from older bindings and str from newer ones"""
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def _query(query: Callable, *args, default=None):
+    """Run an optional NVML query, returning default when the device doesn't support it"""
+    try:
+        return query(*args)
+    except Exception:
+        return default
+
+
+def aggregate_metrics(devices: List[GPUMetrics]) -> GPUMetrics:
+    """
+    Combine per-device readings into node totals: power and memory are summed,
+    utilization is averaged and temperature is the hottest device.
+    """
+    if len(devices) == 1:
+        return devices[0]
+    names = sorted({device.gpu_name for device in devices})
+    if len(names) == 1:
+        name = f"{len(devices)}x {names[0]}"
+    else:
+        name = ", ".join(names)
+    return GPUMetrics(
+        power_watts=sum(device.power_watts for device in devices),
+        temperature_celsius=max(device.temperature_celsius for device in devices),
+        memory_used_mb=sum(device.memory_used_mb for device in devices),
+        memory_total_mb=sum(device.memory_total_mb for device in devices),
+        utilization_percent=sum(device.utilization_percent for device in devices) / len(devices),
+        gpu_name=name,
+        is_simulated=any(device.is_simulated for device in devices),
+        index=-1,
+        device_count=len(devices),
+        energy_mj=(
+            sum(device.energy_mj for device in devices)
+            if all(device.energy_mj is not None for device in devices) else None
+        )
+    )
 
 
 class GPUMonitor:
     """Monitor GPU metrics using NVML or simulation fallback"""
     
-    def __init__(self):
+    def __init__(self, simulated_devices: int = 1):
         self.nvml_initialized = False
-        self.handle = None
+        self.handles = []
+        self.device_count = 0
         self.simulated = False
         self.job_running = False
         self._sim_start_time = time.time()
@@ -45,6 +107,14 @@ class GPUMonitor:
         self._sim_base_temp = 35.0   # Idle temperature
         self._sim_max_temp = 85.0    # Max temperature under load
         self._sim_memory_total = 8192.0  # 8GB simulated VRAM
+        self._sim_device_count = max(1, simulated_devices)
+        
+        # Static device properties (name, UUID, memory, limits), cached at init
+        self.devices: List[DeviceInfo] = []
+        # Simulated energy counters: (counter mJ, last power W, last read time) per device
+        self._sim_energy = {}
+        # Serializes device reads, the simulation state and the fallback switch
+        self._lock = threading.Lock()
         
         self._initialize()
     
@@ -55,28 +125,75 @@ class GPUMonitor:
                 pynvml.nvmlInit()
                 device_count = pynvml.nvmlDeviceGetCount()
                 if device_count > 0:
-                    self.handle = pynvml.nvmlDeviceGetHandleByIndex(0)
+                    self.handles = [
+                        pynvml.nvmlDeviceGetHandleByIndex(index) for index in range(device_count)
+                    ]
+                    self.device_count = device_count
+                    self.devices = [
+                        self._read_device_info(index, handle) for index, handle in enumerate(self.handles)
+                    ]
                     self.nvml_initialized = True
-                    print("✓ NVML initialized - Real GPU detected")
+                    print(f"✓ NVML initialized - {device_count} real GPU(s) detected")
                     return
             except Exception as e:
                 print(f"⚠ NVML initialization failed: {e}")
         
         self.simulated = True
-        print("⚠ No GPU detected - Running in simulation mode")
+        self.device_count = self._sim_device_count
+        self.devices = [self._simulated_device_info(index) for index in range(self.device_count)]
+        print(f"⚠ No GPU detected - Running in simulation mode ({self.device_count} device(s))")
+    
+    def _read_device_info(self, index: int, handle) -> DeviceInfo:
+        """Query a device's static properties once"""
+        power_limit_mw = _query(pynvml.nvmlDeviceGetPowerManagementLimit, handle)
+        return DeviceInfo(
+            index=index,
+            name=_decode(pynvml.nvmlDeviceGetName(handle)),
+            uuid=_decode(_query(pynvml.nvmlDeviceGetUUID, handle, default="unknown")),
+            memory_total_mb=pynvml.nvmlDeviceGetMemoryInfo(handle).total / (1024 * 1024),
+            power_limit_watts=power_limit_mw / 1000.0 if power_limit_mw is not None else None,
+            pci_bus_id=_decode(getattr(
+                _query(pynvml.nvmlDeviceGetPciInfo, handle), "busId", "unknown"
+            )),
+            # Cumulative energy counter (Volta and newer)
+            energy_counter_supported=_query(
+                pynvml.nvmlDeviceGetTotalEnergyConsumption, handle
+            ) is not None
+        )
+    
+    def _simulated_device_info(self, index: int) -> DeviceInfo:
+        """Static properties of a simulated device"""
+        return DeviceInfo(
+            index=index,
+            name="Simulated GPU (Demo Mode)",
+            uuid=f"GPU-SIMULATED-{index:04d}",
+            memory_total_mb=self._sim_memory_total,
+            power_limit_watts=self._sim_max_power,
+            pci_bus_id=f"00000000:{index + 1:02X}:00.0",
+            energy_counter_supported=True
+        )
+    
+    def _advance_sim_energy(self, index: int, power_watts: float) -> float:
+        """Advance a simulated device's energy counter with the trapezoid of the last two readings"""
+        now = time.time()
+        counter_mj, last_power, last_time = self._sim_energy.get(index, (0.0, power_watts, now))
+        counter_mj += (last_power + power_watts) / 2 * (now - last_time) * 1000
+        self._sim_energy[index] = (counter_mj, power_watts, now)
+        return counter_mj
     
     def set_job_running(self, running: bool):
         """Set whether a heavy job is running (for simulation)"""
-        self.job_running = running
-        if running:
-            self._sim_start_time = time.time()
+        with self._lock:
+            if running and not self.job_running:
+                self._sim_start_time = time.time()
+            self.job_running = running
     
-    def _get_simulation_metrics(self) -> GPUMetrics:
+    def _get_simulation_metrics(self, index: int = 0) -> GPUMetrics:
         """Generate simulated GPU metrics"""
         elapsed = time.time() - self._sim_start_time
         
-        # Base oscillation for idle state (breathing pattern)
-        idle_wave = math.sin(elapsed * 0.5) * 0.1 + 1.0
+        # Base oscillation for idle state (breathing pattern), phase-shifted per device
+        idle_wave = math.sin(elapsed * 0.5 + index) * 0.1 + 1.0
         
         if self.job_running:
             # Ramp up to heavy load with some noise
@@ -94,60 +211,70 @@ class GPUMonitor:
             utilization = random.uniform(0, 8)
             memory_used = self._sim_memory_total * 0.15 + random.uniform(0, 200)
         
+        power = max(5.0, power)
         return GPUMetrics(
-            power_watts=max(5.0, power),
+            power_watts=power,
             temperature_celsius=max(25.0, temp),
             memory_used_mb=memory_used,
             memory_total_mb=self._sim_memory_total,
             utilization_percent=min(100, max(0, utilization)),
             gpu_name="Simulated GPU (Demo Mode)",
-            is_simulated=True
+            is_simulated=True,
+            index=index,
+            energy_mj=self._advance_sim_energy(index, power)
         )
     
-    def _get_real_metrics(self) -> GPUMetrics:
-        """Get real GPU metrics via NVML"""
-        try:
-            # Power usage
-            power_mw = pynvml.nvmlDeviceGetPowerUsage(self.handle)
-            power_watts = power_mw / 1000.0
-            
-            # Temperature
-            temp = pynvml.nvmlDeviceGetTemperature(self.handle, pynvml.NVML_TEMPERATURE_GPU)
-            
-            # Memory
-            mem_info = pynvml.nvmlDeviceGetMemoryInfo(self.handle)
-            memory_used_mb = mem_info.used / (1024 * 1024)
-            memory_total_mb = mem_info.total / (1024 * 1024)
-            
-            # Utilization
-            util = pynvml.nvmlDeviceGetUtilizationRates(self.handle)
-            utilization = util.gpu
-            
-            # GPU Name
-            name = pynvml.nvmlDeviceGetName(self.handle)
-            if isinstance(name, bytes):
-                name = name.decode('utf-8')
-            
-            return GPUMetrics(
-                power_watts=power_watts,
-                temperature_celsius=float(temp),
-                memory_used_mb=memory_used_mb,
-                memory_total_mb=memory_total_mb,
-                utilization_percent=float(utilization),
-                gpu_name=name,
-                is_simulated=False
-            )
-        except Exception as e:
-            print(f"⚠ Error reading GPU metrics: {e}")
-            # Fall back to simulation on error
-            self.simulated = True
-            return self._get_simulation_metrics()
+    def _get_real_metrics(self, index: int = 0) -> GPUMetrics:
+        """Get real GPU metrics via NVML (static properties come from the cached DeviceInfo)"""
+        handle = self.handles[index]
+        info = self.devices[index]
+        # Power usage
+        power_mw = pynvml.nvmlDeviceGetPowerUsage(handle)
+        power_watts = power_mw / 1000.0
+        
+        # Temperature
+        temp = pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
+        
+        # Memory
+        mem_info = pynvml.nvmlDeviceGetMemoryInfo(handle)
+        memory_used_mb = mem_info.used / (1024 * 1024)
+        
+        # Utilization
+        util = pynvml.nvmlDeviceGetUtilizationRates(handle)
+        utilization = util.gpu
+        
+        # Cumulative energy counter (mJ since driver load), if supported
+        energy_mj = None
+        if info.energy_counter_supported:
+            energy_mj = float(pynvml.nvmlDeviceGetTotalEnergyConsumption(handle))
+        
+        return GPUMetrics(
+            power_watts=power_watts,
+            temperature_celsius=float(temp),
+            memory_used_mb=memory_used_mb,
+            memory_total_mb=info.memory_total_mb,
+            utilization_percent=float(utilization),
+            gpu_name=info.name,
+            is_simulated=False,
+            index=index,
+            energy_mj=energy_mj
+        )
+    
+    def get_all_metrics(self) -> List[GPUMetrics]:
+        """Get current metrics of every device in one pass (real or simulated)"""
+        with self._lock:
+            if not self.simulated and self.nvml_initialized:
+                try:
+                    return [self._get_real_metrics(index) for index in range(self.device_count)]
+                except Exception as e:
+                    print(f"⚠ Error reading GPU metrics: {e}")
+                    # Fall back to simulation on error
+                    self.simulated = True
+            return [self._get_simulation_metrics(index) for index in range(self.device_count)]
     
     def get_metrics(self) -> GPUMetrics:
-        """Get current GPU metrics (real or simulated)"""
-        if self.simulated or not self.nvml_initialized:
-            return self._get_simulation_metrics()
-        return self._get_real_metrics()
+        """Get current node-total GPU metrics (real or simulated)"""
+        return aggregate_metrics(self.get_all_metrics())
     
     def shutdown(self):
         """Clean up NVML resources"""
@@ -162,9 +289,9 @@ class GPUMonitor:
 _monitor: Optional[GPUMonitor] = None
 
 
-def get_monitor() -> GPUMonitor:
+def get_monitor(simulated_devices: int = 1) -> GPUMonitor:
     """Get or create the global GPU monitor instance"""
     global _monitor
     if _monitor is None:
-        _monitor = GPUMonitor()
+        _monitor = GPUMonitor(simulated_devices=simulated_devices)
     return _monitor
@@ -0,0 +1,192 @@
+"""
+Job Tracking - EcoCompute AI / GreenGL
+Per-job energy and emissions ledgers for concurrent jobs
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from energy import IntervalEnergy
+
+DEFAULT_MAX_FINISHED_JOBS = 100  # Finished ledgers kept for /job/<id> lookups
+
+
+def _pid_alive(pid: int) -> bool:
+    """Check whether a process exists (signal 0 only probes, it doesn't deliver)"""
+    if os.name == "nt":
+        return True  # os.kill would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists but belongs to another user
+    return True
+
+
+@dataclass
+class JobLedger:
+    """Energy and emissions accumulated by one job"""
+    job_id: str
+    start_time: float
+    gpu_index: Optional[int] = None  # None = whole node
+    pid: Optional[int] = None  # Job stops automatically when this process exits
+    name: Optional[str] = None
+    end_time: Optional[float] = None
+    energy_wh: float = 0.0
+    emissions_g: float = 0.0
+    error_wh: float = 0.0
+    counter_wh: float = 0.0  # Share of energy_wh measured by the hardware counter
+    drift_wh: float = 0.0  # Integrated minus counter energy over counter-measured intervals
+
+    @property
+    def running(self) -> bool:
+        return self.end_time is None
+
+    @property
+    def energy_source(self) -> str:
+        return "counter" if self.counter_wh > 0 else "integrated"
+
+    def runtime_seconds(self, now: Optional[float] = None) -> float:
+        end = self.end_time if self.end_time is not None else (now or time.time())
+        return max(0.0, end - self.start_time)
+
+    def record(self, interval: IntervalEnergy, carbon_intensity: float):
+        """Add the part of an interval that overlaps the job"""
+        end = interval.end_time if self.end_time is None else min(interval.end_time, self.end_time)
+        overlap = end - max(interval.start_time, self.start_time)
+        if overlap <= 0:
+            return
+        fraction = min(1.0, overlap / (interval.end_time - interval.start_time))
+        energy_wh = interval.energy_wh * fraction
+        self.energy_wh += energy_wh
+        self.emissions_g += energy_wh / 1000 * carbon_intensity
+        self.error_wh += interval.error_wh * fraction
+        if interval.counter_wh is not None:
+            self.counter_wh += energy_wh
+            self.drift_wh += (interval.integrated_wh - interval.counter_wh) * fraction
+
+    def to_dict(self, now: Optional[float] = None) -> dict:
+        return {
+            "job_id": self.job_id,
+            "name": self.name,
+            "gpu_index": self.gpu_index,
+            "pid": self.pid,
+            "running": self.running,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "runtime_seconds": round(self.runtime_seconds(now), 1),
+            "energy_wh": round(self.energy_wh, 6),
+            "emissions_g": round(self.emissions_g, 4),
+            "energy_source": self.energy_source,
+            "energy_error_wh": round(self.error_wh, 6),
+            "energy_drift_wh": round(self.drift_wh, 6) if self.counter_wh > 0 else None
+        }
+
+
+class JobTracker:
+    """
+    Registry of concurrent jobs, updated in one pass per sample.
+
+    Ledgers are only mutated under the tracker's lock; request handlers
+    should read them through describe() to get a consistent copy.
+    """
+
+    def __init__(self, max_finished: int = DEFAULT_MAX_FINISHED_JOBS):
+        self.max_finished = max_finished
+        self._jobs: "OrderedDict[str, JobLedger]" = OrderedDict()
+        self._recorded_until = 0.0  # End of the newest interval credited so far
+        self._lock = threading.RLock()
+
+    def start(
+        self,
+        gpu_index: Optional[int] = None,
+        pid: Optional[int] = None,
+        name: Optional[str] = None
+    ) -> JobLedger:
+        """Start a new job and return its ledger"""
+        job = JobLedger(
+            job_id=uuid.uuid4().hex[:12],
+            start_time=time.time(),
+            gpu_index=gpu_index,
+            pid=pid,
+            name=name
+        )
+        with self._lock:
+            self._jobs[job.job_id] = job
+        return job
+
+    def stop(self, job_id: str) -> JobLedger:
+        """Stop a job (no-op if already stopped); raises KeyError for unknown IDs"""
+        with self._lock:
+            job = self._jobs[job_id]
+            if job.running:
+                job.end_time = time.time()
+                self._prune()
+            return job
+
+    def get(self, job_id: str) -> Optional[JobLedger]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def all(self) -> List[JobLedger]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def active(self) -> List[JobLedger]:
+        with self._lock:
+            return [job for job in self._jobs.values() if job.running]
+
+    def current(self) -> Optional[JobLedger]:
+        """Most recently started job that is still running"""
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if job.running:
+                    return job
+            return None
+
+    def describe(self, job_id: Optional[str] = None):
+        """Consistent dict copy of one job (None if unknown), or of all jobs when no ID is given"""
+        now = time.time()
+        with self._lock:
+            if job_id is None:
+                return [job.to_dict(now) for job in self._jobs.values()]
+            job = self._jobs.get(job_id)
+            return job.to_dict(now) if job else None
+
+    def record(
+        self,
+        node: Optional[IntervalEnergy],
+        devices: Dict[int, Optional[IntervalEnergy]],
+        carbon_intensity: float
+    ):
+        """
+        Credit one sample's interval energy to every job it overlaps: running
+        jobs, and jobs stopped since the previous sample (for their final part).
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.running and job.pid is not None and not _pid_alive(job.pid):
+                    job.end_time = time.time()
+                interval = node if job.gpu_index is None else devices.get(job.gpu_index)
+                if interval is not None and (job.running or job.end_time > interval.start_time):
+                    job.record(interval, carbon_intensity)
+            ends = [interval.end_time for interval in (node, *devices.values()) if interval is not None]
+            self._recorded_until = max([self._recorded_until, *ends])
+            self._prune()
+
+    def _prune(self):
+        """
+        Drop the finished ledgers that ended longest ago beyond max_finished
+        (caller holds the lock). A job stopped after the newest recorded
+        interval is kept until the next sample credits its final part.
+        """
+        finished = sorted((job for job in self._jobs.values() if not job.running), key=lambda job: job.end_time)
+        settled = [job for job in finished if job.end_time <= self._recorded_until]
+        for job in settled[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job.job_id]
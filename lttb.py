@@ -0,0 +1,47 @@
+"""
+LTTB Downsampling - EcoCompute AI / GreenGL
+Largest-Triangle-Three-Buckets point selection for chart-sized series
+"""
+
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Indices of at most `points` samples of (x, y) chosen with LTTB.
+
+    The first and last samples are always kept; the rest are split into
+    points - 2 buckets and each bucket keeps the sample forming the largest
+    triangle with the previously kept sample and the next bucket's average.
+    Bucket averages are precomputed in one pass and each bucket's areas are
+    computed as one array operation.
+    """
+    size = len(x)
+    if points >= size:
+        return np.arange(size)
+    if points <= 2:
+        return np.array([0, size - 1][:max(points, 0)], dtype=np.int64)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Bucket boundaries over the interior samples [1, size - 1)
+    edges = np.linspace(1, size - 1, points - 1).astype(np.int64)
+    counts = np.diff(edges)
+    # Average of every bucket, plus the last sample as the "bucket" after the final one
+    avg_x = np.append(np.add.reduceat(x[:-1], edges[:-1]) / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[:-1], edges[:-1]) / counts, y[-1])
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, size - 1
+    previous = 0
+    for bucket in range(points - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        next_x, next_y = avg_x[bucket + 1], avg_y[bucket + 1]
+        prev_x, prev_y = x[previous], y[previous]
+        # Twice the triangle area; the constant factor doesn't change the argmax
+        areas = np.abs(
+            (prev_x - next_x) * (y[lo:hi] - prev_y) - (prev_x - x[lo:hi]) * (next_y - prev_y)
+        )
+        previous = lo + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
@@ -0,0 +1,130 @@
+"""
+Prometheus Exposition - EcoCompute AI / GreenGL
+Text-format metrics rendered once per sample, plus request latency histograms
+"""
+
+import bisect
+import threading
+from typing import Dict, List, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Request latency histogram buckets (seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value) -> str:
+    """Escape a label value"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class _Family:
+    """Accumulates the HELP/TYPE header and samples of one metric"""
+
+    def __init__(self, lines: List[str], name: str, kind: str, help_text: str):
+        self.lines = lines
+        self.name = name
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, value: float, suffix: str = "", **labels):
+        label_text = _labels(**labels) if labels else ""
+        self.lines.append(f"{self.name}{suffix}{label_text} {float(value)!r}")
+
+
+class LatencyHistogram:
+    """Cumulative request latency histograms keyed by (endpoint, method)"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # (endpoint, method) -> [per-bucket counts (+Inf last), sum]
+        self._series: Dict[Tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint: str, method: str, seconds: float):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get((endpoint, method))
+            if series is None:
+                series = self._series[(endpoint, method)] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    def render(self, name: str = "ecocompute_http_request_duration_seconds") -> str:
+        lines: List[str] = []
+        family = _Family(lines, name, "histogram", "HTTP request latency by endpoint.")
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in sorted(self._series.items())]
+        for (endpoint, method), counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                family.sample(cumulative, "_bucket", endpoint=endpoint, method=method, le=le)
+            family.sample(total, "_sum", endpoint=endpoint, method=method)
+            family.sample(cumulative, "_count", endpoint=endpoint, method=method)
+        return "\n".join(lines) + "\n"
+
+
+class PrometheusExporter:
+    """
+    Keeps the exposition text of the latest sample ready to serve.
+
+    update() renders the sample's gauges and counters into a byte buffer on
+    the sampler thread; a scrape only joins that buffer with the (small)
+    latency histograms.
+    """
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self._buffer = b""
+
+    def update(self, snapshot: dict, calculator, sample_count: int):
+        """Render the exposition text for a new sample (called by the sampler)"""
+        lines: List[str] = []
+        gpus = snapshot["gpus"]
+
+        gauges = (
+            ("ecocompute_gpu_power_watts", "power_watts", 1.0, "Current GPU power draw."),
+            ("ecocompute_gpu_temperature_celsius", "temperature_celsius", 1.0, "GPU temperature."),
+            ("ecocompute_gpu_utilization_ratio", "utilization_percent", 0.01, "GPU utilization (0-1)."),
+            ("ecocompute_gpu_memory_used_bytes", "memory_used_mb", 1024 * 1024, "GPU memory in use."),
+            ("ecocompute_gpu_memory_total_bytes", "memory_total_mb", 1024 * 1024, "GPU memory capacity."),
+        )
+        for name, key, scale, help_text in gauges:
+            family = _Family(lines, name, "gauge", help_text)
+            for device in gpus:
+                family.sample(round(device[key] * scale, 6), gpu=device["index"], name=device["name"])
+
+        # Cumulative energy per GPU and for the node, from the calculator's meters
+        family = _Family(lines, "ecocompute_gpu_energy_joules_total", "counter", "Energy drawn by each GPU since startup.")
+        for index, meter in sorted(calculator.device_meters.items()):
+            family.sample(meter.total_wh * 3600, gpu=index)
+        family = _Family(lines, "ecocompute_node_energy_joules_total", "counter", "Energy drawn by all GPUs since startup.")
+        family.sample(calculator.node_meter.total_wh * 3600)
+        family = _Family(lines, "ecocompute_emissions_grams_total", "counter", "CO2 emitted by all GPUs since startup.")
+        family.sample(calculator.total_emissions_g)
+
+        family = _Family(lines, "ecocompute_carbon_intensity_grams_per_kwh", "gauge", "Grid carbon intensity per zone.")
+        for zone, reading in sorted(calculator.cache.readings().items()):
+            family.sample(reading.intensity, zone=zone, region=reading.region, mocked=str(reading.is_mocked).lower())
+
+        family = _Family(lines, "ecocompute_jobs_active", "gauge", "Jobs currently being tracked.")
+        family.sample(snapshot["job"]["active_jobs"])
+        family = _Family(lines, "ecocompute_samples_total", "counter", "Samples collected by the background sampler.")
+        family.sample(sample_count)
+        family = _Family(lines, "ecocompute_last_sample_timestamp_seconds", "gauge", "Time of the latest sample.")
+        family.sample(snapshot["timestamp"])
+
+        self._buffer = ("\n".join(lines) + "\n").encode("utf-8")
+
+    def observe_request(self, endpoint: str, method: str, seconds: float):
+        self.latency.observe(endpoint, method, seconds)
+
+    def render(self) -> bytes:
+        """Full exposition: the precomputed sample text plus latency histograms"""
+        return self._buffer + self.latency.render().encode("utf-8")
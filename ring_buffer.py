@@ -0,0 +1,169 @@
+"""
+Ring Buffer - EcoCompute AI / GreenGL
+Fixed-capacity circular buffer for metric history
+"""
+
+import threading
+from typing import Any, Iterator, List, Optional
+
+
+class RingBuffer:
+    """
+    Preallocated circular buffer with O(1) append and indexed access.
+
+    Besides logical indices (0 = oldest retained item), every item has an
+    absolute position: the number of items appended before it (plus
+    `first_position`, to continue a sequence from a previous run). Positions
+    never shift on eviction, so readers can page through the buffer while the
+    sampler keeps appending.
+    """
+
+    def __init__(self, capacity: int, first_position: int = 0):
+        if capacity <= 0:
+            raise ValueError("Capacity must be positive")
+        self.capacity = capacity
+        self._allocate()
+        self._size = 0
+        self._total = first_position  # Absolute end position
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    @property
+    def start_position(self) -> int:
+        """Absolute position of the oldest retained item"""
+        return self._total - self._size
+
+    @property
+    def end_position(self) -> int:
+        """Absolute position the next appended item will get"""
+        return self._total
+
+    def _slot(self, position: int) -> int:
+        return position % self.capacity
+
+    # Storage hooks - subclasses override these to change the slot layout
+
+    def _allocate(self):
+        """Allocate storage for `capacity` slots"""
+        self._items: List[Any] = [None] * self.capacity
+
+    def _prepare(self, item: Any) -> Any:
+        """Validate/convert an item before anything is evicted; raising leaves the buffer unchanged"""
+        return item
+
+    def _write(self, slot: int, item: Any):
+        """Store an item (as returned by _prepare) in a slot"""
+        self._items[slot] = item
+
+    def _evict(self, slot: int):
+        """Called before the oldest item's slot is overwritten"""
+
+    def _read_slots(self, lo: int, hi: int) -> List[Any]:
+        """Read the contiguous slots [lo, hi)"""
+        return self._items[lo:hi]
+
+    def append(self, item: Any) -> int:
+        """Append an item, evicting the oldest when full. Returns its position."""
+        with self._lock:
+            item = self._prepare(item)
+            position = self._total
+            slot = self._slot(position)
+            if self._size == self.capacity:
+                self._evict(slot)
+            self._write(slot, item)
+            self._total += 1
+            if self._size < self.capacity:
+                self._size += 1
+            return position
+
+    def clear(self):
+        """Drop all items (positions keep increasing)"""
+        with self._lock:
+            self._allocate()
+            self._size = 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._size)
+            if step != 1:
+                return self.get_range(start, stop)[::step]
+            return self.get_range(start, stop)
+        with self._lock:
+            if index < 0:
+                index += self._size
+            if not 0 <= index < self._size:
+                raise IndexError("RingBuffer index out of range")
+            slot = self._slot(self._total - self._size + index)
+            return self._read_slots(slot, slot + 1)[0]
+
+    def get_range(self, start: int, stop: int) -> List[Any]:
+        """Copy the items at logical indices [start, stop)"""
+        with self._lock:
+            base = self._total - self._size
+            return self._read(base + max(0, start), base + min(stop, self._size))
+
+    def get_positions(self, start: int, stop: int) -> List[Any]:
+        """Copy the items at absolute positions [start, stop) that are still retained"""
+        with self._lock:
+            return self._read(
+                max(start, self._total - self._size),
+                min(stop, self._total)
+            )
+
+    def _read(self, start: int, stop: int) -> List[Any]:
+        """Read absolute positions [start, stop); caller holds the lock"""
+        items: List[Any] = []
+        for lo, hi in self._segments(start, stop):
+            items += self._read_slots(lo, hi)
+        return items
+
+    def _segments(self, start: int, stop: int) -> List[tuple]:
+        """Split absolute positions [start, stop) into contiguous (lo, hi) slot ranges"""
+        if start >= stop:
+            return []
+        lo, hi = self._slot(start), self._slot(stop - 1) + 1
+        if lo < hi:
+            return [(lo, hi)]
+        return [(lo, self.capacity), (0, hi)]
+
+    def iter_positions(
+        self,
+        start: Optional[int] = None,
+        stop: Optional[int] = None,
+        chunk_size: int = 1000
+    ) -> Iterator[Any]:
+        """
+        Iterate over absolute positions [start, stop) in chunks, holding the
+        lock only while each chunk is copied. Items evicted before they are
+        reached are skipped.
+        """
+        position = self.start_position if start is None else start
+        stop = self.end_position if stop is None else stop
+        while position < stop:
+            with self._lock:
+                position = max(position, self._total - self._size)
+                chunk_end = min(position + chunk_size, stop, self._total)
+                chunk = self._read(position, chunk_end)
+            if not chunk:
+                return
+            yield from chunk
+            position = chunk_end
+
+    def __iter__(self) -> Iterator[Any]:
+        return self.iter_positions()
+
+    def first(self) -> Optional[Any]:
+        """Oldest retained item, or None if empty"""
+        with self._lock:
+            start = self._total - self._size
+            return self._read(start, start + 1)[0] if self._size else None
+
+    def last(self) -> Optional[Any]:
+        """Newest item, or None if empty"""
+        with self._lock:
+            return self._read(self._total - 1, self._total)[0] if self._size else None
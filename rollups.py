@@ -0,0 +1,281 @@
+"""
+Rollups - EcoCompute AI / GreenGL
+Continuous downsampling of raw samples into per-minute and per-hour buckets
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ring_buffer import RingBuffer
+
+# Snapshot fields summarized per bucket: (section, key)
+ROLLUP_FIELDS = {
+    "power_watts": ("gpu", "power_watts"),
+    "temperature_celsius": ("gpu", "temperature_celsius"),
+    "utilization_percent": ("gpu", "utilization_percent"),
+    "intensity_g_per_kwh": ("carbon", "intensity_g_per_kwh"),
+}
+
+# Flat column layout of one bucket (also the SQLite rollup table layout)
+ROLLUP_COLUMNS: List[Tuple[str, str]] = (
+    [("timestamp", "float64"), ("count", "uint32")]
+    + [(f"{field}_{stat}", "float64") for field in ROLLUP_FIELDS for stat in ("min", "max", "avg")]
+    + [("energy_wh", "float64"), ("emissions_g", "float64")]
+)
+
+# Gaps longer than this (e.g. the app was stopped) are not counted as energy
+MAX_SAMPLE_GAP = 60.0
+
+
+@dataclass(frozen=True)
+class TierSpec:
+    """Bucket width and retention of one rollup tier"""
+    name: str
+    seconds: int
+    retention_seconds: int
+
+    @property
+    def capacity(self) -> int:
+        return max(1, self.retention_seconds // self.seconds)
+
+
+DEFAULT_TIERS = (
+    TierSpec("1m", 60, 7 * 24 * 3600),  # One week of minutes
+    TierSpec("1h", 3600, 90 * 24 * 3600),  # Three months of hours
+)
+
+
+def _new_bucket(start: float) -> Dict[str, float]:
+    bucket = {name: 0.0 for name, _ in ROLLUP_COLUMNS}
+    bucket["timestamp"] = start
+    for field in ROLLUP_FIELDS:
+        bucket[f"{field}_min"] = float("inf")
+        bucket[f"{field}_max"] = float("-inf")
+    return bucket
+
+
+def _merge(bucket: Dict[str, float], other: Dict[str, float]):
+    """Fold a finer bucket (or a one-sample bucket) into a coarser one"""
+    count = bucket["count"] + other["count"]
+    if count == 0:
+        return
+    for field in ROLLUP_FIELDS:
+        bucket[f"{field}_min"] = min(bucket[f"{field}_min"], other[f"{field}_min"])
+        bucket[f"{field}_max"] = max(bucket[f"{field}_max"], other[f"{field}_max"])
+        bucket[f"{field}_avg"] = (
+            bucket[f"{field}_avg"] * bucket["count"] + other[f"{field}_avg"] * other["count"]
+        ) / count
+    bucket["count"] = count
+    bucket["energy_wh"] += other["energy_wh"]
+    bucket["emissions_g"] += other["emissions_g"]
+
+
+def bucket_record(bucket: Dict[str, float], tier: str, seconds: int, partial: bool = False) -> Dict[str, Any]:
+    """API form of a bucket"""
+    record: Dict[str, Any] = {
+        "timestamp": bucket["timestamp"],
+        "resolution": tier,
+        "duration_seconds": seconds,
+        "count": int(bucket["count"]),
+    }
+    for field in ROLLUP_FIELDS:
+        record[field] = {
+            "min": round(bucket[f"{field}_min"], 2),
+            "max": round(bucket[f"{field}_max"], 2),
+            "avg": round(bucket[f"{field}_avg"], 2),
+        }
+    record["energy_wh"] = round(bucket["energy_wh"], 6)
+    record["emissions_g"] = round(bucket["emissions_g"], 6)
+    if partial:
+        record["partial"] = True  # Bucket still collecting samples
+    return record
+
+
+class RollupTier(RingBuffer):
+    """Closed buckets of one tier, stored column-wise; capacity enforces retention"""
+
+    def __init__(self, spec: TierSpec):
+        self.spec = spec
+        super().__init__(spec.capacity)
+
+    def _allocate(self):
+        self._columns: Dict[str, np.ndarray] = {
+            name: np.zeros(self.capacity, dtype=dtype) for name, dtype in ROLLUP_COLUMNS
+        }
+
+    def _write(self, slot: int, item: Dict[str, float]):
+        for name, _ in ROLLUP_COLUMNS:
+            self._columns[name][slot] = item[name]
+
+    def _read_slots(self, lo: int, hi: int) -> List[Dict[str, Any]]:
+        columns = {name: self._columns[name][lo:hi].tolist() for name, _ in ROLLUP_COLUMNS}
+        return [
+            bucket_record(dict(zip(columns, values)), self.spec.name, self.spec.seconds)
+            for values in zip(*columns.values())
+        ]
+
+    def positions_between(self, start_time: Optional[float] = None, end_time: Optional[float] = None):
+        """Positions [start, stop) of buckets that overlap [start_time, end_time]"""
+        with self._lock:
+            start = stop = self._total - self._size
+            for lo, hi in self._segments(start, self._total):
+                timestamps = self._columns["timestamp"][lo:hi]
+                if start_time is not None:
+                    # A bucket overlaps when it ends after start_time
+                    start += int(np.searchsorted(timestamps, start_time - self.spec.seconds, side="right"))
+                stop += hi - lo if end_time is None else int(
+                    np.searchsorted(timestamps, end_time, side="right"))
+            return start, max(start, stop)
+
+    def rows_since(self, timestamp: float) -> List[Dict[str, float]]:
+        """Flat rows of the buckets starting at or after `timestamp`, oldest first"""
+        with self._lock:
+            rows = []
+            for lo, hi in self._segments(self._total - self._size, self._total):
+                lo += int(np.searchsorted(self._columns["timestamp"][lo:hi], timestamp, side="left"))
+                columns = {name: self._columns[name][lo:hi].tolist() for name, _ in ROLLUP_COLUMNS}
+                rows.extend(dict(zip(columns, values)) for values in zip(*columns.values()))
+            return rows
+
+    def oldest_timestamp(self) -> Optional[float]:
+        with self._lock:
+            return float(self._columns["timestamp"][self._slot(self._total - self._size)]) if self._size else None
+
+
+class Downsampler:
+    """
+    Aggregates raw snapshots into cascading tiers (raw -> 1m -> 1h).
+
+    Each tier keeps one open bucket; when a sample falls past its end, the
+    bucket is closed into the tier's ring buffer and folded into the next
+    tier's open bucket. Closed buckets are also handed to `on_close` (e.g. a
+    persistent store) as flat rows.
+    """
+
+    def __init__(
+        self,
+        tiers: Tuple[TierSpec, ...] = DEFAULT_TIERS,
+        on_close: Optional[Callable[[str, Dict[str, float]], None]] = None
+    ):
+        self.tiers = [RollupTier(spec) for spec in tiers]
+        self.on_close = on_close
+        self._open: List[Optional[Dict[str, float]]] = [None] * len(self.tiers)
+        self._last: Optional[Tuple[float, float]] = None  # (timestamp, power) of the previous sample
+        self._lock = threading.Lock()
+
+    def tier(self, name: str) -> Optional[RollupTier]:
+        for tier in self.tiers:
+            if tier.spec.name == name:
+                return tier
+        return None
+
+    def restore(self, name: str, rows: List[Dict[str, float]]):
+        """
+        Load previously persisted closed buckets (oldest first) into a tier.
+
+        Restore tiers finest first: a coarser tier's open bucket is rebuilt
+        from the finer buckets that closed after its newest closed one, so the
+        bucket a restart falls in still counts what was sampled before it.
+        """
+        level = next((i for i, tier in enumerate(self.tiers) if tier.spec.name == name), None)
+        if level is None:
+            return
+        tier = self.tiers[level]
+        for row in rows:
+            tier.append(row)
+        if level == 0:
+            return
+        since = rows[-1]["timestamp"] + tier.spec.seconds if rows else float("-inf")
+        with self._lock:
+            self._open[level] = None
+            for row in self.tiers[level - 1].rows_since(since):
+                self._fold(level, row, row["timestamp"])
+
+    def add(self, snapshot: dict):
+        """Fold one raw snapshot into the open buckets"""
+        timestamp = snapshot["timestamp"]
+        power = snapshot["gpu"]["power_watts"]
+        sample = _new_bucket(timestamp)
+        sample["count"] = 1
+        for field, (section, key) in ROLLUP_FIELDS.items():
+            value = float(snapshot[section][key])
+            sample[f"{field}_min"] = sample[f"{field}_max"] = sample[f"{field}_avg"] = value
+        # Trapezoid energy since the previous sample, priced at the current intensity
+        if self._last is not None and 0 < timestamp - self._last[0] <= MAX_SAMPLE_GAP:
+            sample["energy_wh"] = (self._last[1] + power) / 2 * (timestamp - self._last[0]) / 3600.0
+            sample["emissions_g"] = sample["energy_wh"] / 1000 * snapshot["carbon"]["intensity_g_per_kwh"]
+        self._last = (timestamp, power)
+
+        with self._lock:
+            self._fold(0, sample, timestamp)
+
+    def _fold(self, level: int, item: Dict[str, float], timestamp: float):
+        """Add an item to a tier's open bucket, closing it first if the item is past its end"""
+        tier = self.tiers[level]
+        start = timestamp - timestamp % tier.spec.seconds
+        bucket = self._open[level]
+        if bucket is not None and bucket["timestamp"] != start:
+            tier.append(bucket)
+            if self.on_close is not None:
+                self.on_close(tier.spec.name, bucket)
+            if level + 1 < len(self.tiers):
+                self._fold(level + 1, bucket, bucket["timestamp"])
+            bucket = None
+        if bucket is None:
+            bucket = self._open[level] = _new_bucket(start)
+        _merge(bucket, item)
+
+    def open_record(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        The tier's bucket that is still collecting samples, if any, including
+        the samples still held in the open buckets of finer tiers.
+        """
+        with self._lock:
+            view = None
+            for tier, bucket in zip(self.tiers, self._open):
+                if view is not None:
+                    start = view["timestamp"] - view["timestamp"] % tier.spec.seconds
+                    if bucket is None or bucket["timestamp"] == start:
+                        merged = dict(bucket) if bucket is not None else _new_bucket(start)
+                        _merge(merged, view)
+                        view = merged
+                    else:
+                        view = dict(bucket)  # Finer samples belong to the next bucket
+                elif bucket is not None:
+                    view = dict(bucket)
+                if tier.spec.name == name:
+                    return bucket_record(view, name, tier.spec.seconds, partial=True) if view else None
+        return None
+
+    def query(
+        self,
+        name: str,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Buckets of a tier overlapping [start_time, end_time], newest `limit` only"""
+        tier = self.tier(name)
+        start, stop = tier.positions_between(start_time, end_time)
+        records = tier.get_positions(start, stop)
+        current = self.open_record(name)
+        if current is not None and (end_time is None or current["timestamp"] <= end_time):
+            records.append(current)
+        return records if limit is None else records[max(0, len(records) - limit):]
+
+    def count_between(self, name: str, start_time: Optional[float] = None, end_time: Optional[float] = None) -> int:
+        """Number of buckets query() would return without a limit"""
+        start, stop = self.tier(name).positions_between(start_time, end_time)
+        current = self.open_record(name)
+        return stop - start + (current is not None and (end_time is None or current["timestamp"] <= end_time))
+
+    def covers(self, name: str, start_time: Optional[float]) -> bool:
+        """Whether a tier still holds data back to start_time (or has never evicted any)"""
+        tier = self.tier(name)
+        if start_time is None or tier.start_position == 0:
+            return True
+        oldest = tier.oldest_timestamp()
+        return oldest is not None and oldest <= start_time
@@ -0,0 +1,106 @@
+"""
+Running Statistics - EcoCompute AI / GreenGL
+Incremental aggregates over a sliding window of samples
+"""
+
+import math
+from collections import deque
+from typing import Callable, Optional
+
+
+class RunningStats:
+    """Count, sum, mean and variance maintained with Welford's algorithm"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0  # Sum of squared deviations from the mean
+
+    @classmethod
+    def from_moments(cls, count: int, mean: float, variance: float) -> "RunningStats":
+        """Aggregates seeded from an existing count, mean and population variance"""
+        stats = cls()
+        stats.count = count
+        stats.mean = mean if count else 0.0
+        stats._m2 = variance * count if count else 0.0
+        return stats
+
+    def add(self, value: float):
+        """Include a value in the aggregates"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def remove(self, value: float):
+        """Exclude a previously added value (inverse Welford update)"""
+        if self.count <= 1:
+            self.reset()
+            return
+        delta = value - self.mean
+        self.mean -= delta / (self.count - 1)
+        self._m2 -= delta * (value - self.mean)
+        self.count -= 1
+
+    def reset(self):
+        """Drop all values"""
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    @property
+    def sum(self) -> float:
+        return self.mean * self.count
+
+    @property
+    def variance(self) -> float:
+        """Population variance (clamped against rounding drift)"""
+        if self.count == 0:
+            return 0.0
+        return max(0.0, self._m2 / self.count)
+
+    @property
+    def stddev(self) -> float:
+        return math.sqrt(self.variance)
+
+
+class SlidingExtrema:
+    """
+    Sliding-window min and max using monotonic deques of positions.
+
+    Values are looked up through `value_at(position)` instead of being copied
+    into the deques, so each entry only costs one integer.
+    """
+
+    def __init__(self, value_at: Callable[[int], float]):
+        self._value_at = value_at
+        self._min: deque = deque()  # Positions with increasing values
+        self._max: deque = deque()  # Positions with decreasing values
+
+    def push(self, position: int, value: float):
+        """Add the value stored at `position` (positions must increase)"""
+        while self._min and self._value_at(self._min[-1]) >= value:
+            self._min.pop()
+        self._min.append(position)
+        while self._max and self._value_at(self._max[-1]) <= value:
+            self._max.pop()
+        self._max.append(position)
+
+    def evict_before(self, position: int):
+        """Forget every position older than `position`"""
+        while self._min and self._min[0] < position:
+            self._min.popleft()
+        while self._max and self._max[0] < position:
+            self._max.popleft()
+
+    def reset(self):
+        self._min.clear()
+        self._max.clear()
+
+    @property
+    def min(self) -> Optional[float]:
+        return self._value_at(self._min[0]) if self._min else None
+
+    @property
+    def max(self) -> Optional[float]:
+        return self._value_at(self._max[0]) if self._max else None
@@ -0,0 +1,216 @@
+"""
+Metrics Sampler - EcoCompute AI / GreenGL
+Background collector that samples GPU and carbon data on a fixed schedule
+"""
+
+import time
+import threading
+from typing import Optional
+
+from gpu_monitor import GPUMonitor, GPUMetrics, aggregate_metrics
+from carbon_utils import CarbonCalculator
+from timeseries import TimeSeriesStore
+from sqlite_store import SQLiteStore
+from rollups import Downsampler
+from broadcast import MetricsBroadcaster
+from prometheus import PrometheusExporter
+from serialization import dumps
+
+# Configuration
+DEFAULT_SAMPLE_HZ = 1.0  # Samples per second
+DEFAULT_ZONE = "US-CAL-CISO"
+DEFAULT_MAX_HISTORY = 1000
+
+
+def _gpu_fields(metrics: GPUMetrics) -> dict:
+    """Rounded snapshot fields of one device or of the node totals"""
+    return {
+        "name": metrics.gpu_name,
+        "power_watts": round(metrics.power_watts, 2),
+        "temperature_celsius": round(metrics.temperature_celsius, 1),
+        "utilization_percent": round(metrics.utilization_percent, 1),
+        "memory_used_mb": round(metrics.memory_used_mb, 0),
+        "memory_total_mb": round(metrics.memory_total_mb, 0),
+        "memory_percent": round(
+            (metrics.memory_used_mb / metrics.memory_total_mb) * 100, 1
+        )
+    }
+
+
+class MetricsSampler:
+    """Sample GPU metrics and emissions on a dedicated thread"""
+
+    def __init__(
+        self,
+        monitor: GPUMonitor,
+        calculator: CarbonCalculator,
+        hz: float = DEFAULT_SAMPLE_HZ,
+        zone: str = DEFAULT_ZONE,
+        max_history: int = DEFAULT_MAX_HISTORY,
+        store: Optional[SQLiteStore] = None,
+        rollups: Optional[Downsampler] = None
+    ):
+        if hz <= 0:
+            raise ValueError("Sample rate must be positive")
+        self.monitor = monitor
+        self.calculator = calculator
+        self.interval = 1.0 / hz
+        self.zone = zone
+        # Sequence numbers (= history positions) continue from a persistent store's last sample
+        first_seq = store.end_position if store is not None else 0
+        self.history = TimeSeriesStore(max_history, device_count=monitor.device_count, first_position=first_seq)
+        self.store = store  # Optional persistent history, written in the background
+        self.rollups = rollups if rollups is not None else Downsampler()  # 1m / 1h buckets
+        self.broadcaster = MetricsBroadcaster()  # Live subscribers (/metrics/stream)
+        self.prometheus = PrometheusExporter()  # Exposition text for /metrics/prometheus
+        self.sample_count = 0
+        self._latest: Optional[dict] = None
+        self._latest_encoded: Optional[bytes] = None
+        self._lock = threading.Lock()
+        # Only one thread samples at a time (the sampler or a request forcing a final sample)
+        self._sample_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Take an initial sample and start the background thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.sample_once()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the background thread"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def is_running(self) -> bool:
+        """Check if the background thread is alive"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def set_zone(self, zone: str):
+        """Change the carbon intensity zone used for subsequent samples"""
+        self.zone = zone
+
+    def latest(self) -> Optional[dict]:
+        """Get the most recent snapshot without sampling"""
+        return self._latest
+
+    def latest_encoded(self) -> Optional[bytes]:
+        """Get the most recent snapshot as JSON bytes"""
+        return self._latest_encoded
+
+    def sample_once(self) -> dict:
+        """Collect one sample, publish it as the latest snapshot and record it"""
+        with self._sample_lock:
+            return self._sample()
+
+    def _sample(self) -> dict:
+        """Collect and publish a sample; caller holds the sample lock"""
+        # One pass over every device; emissions are priced on the node total
+        devices = self.monitor.get_all_metrics()
+        gpu_metrics = aggregate_metrics(devices)
+        # Never wait on the carbon API here: a cold zone is mocked until its refresh lands
+        reading = self.calculator.get_reading(zone=self.zone, wait=False)
+        carbon_data = self.calculator.calculate_emissions(
+            gpu_metrics.power_watts,
+            reading.intensity,
+            reading=reading,
+            energy_mj=gpu_metrics.energy_mj,
+            devices=devices
+        )
+
+        # History range queries binary-search timestamps, so never let them go backwards
+        timestamp = time.time()
+        if self._latest is not None:
+            timestamp = max(timestamp, self._latest["timestamp"])
+
+        energy = self.calculator.energy_report()
+        job = self.calculator.jobs.current()
+        snapshot = {
+            "seq": self.history.end_position,  # Position this sample gets; only this thread appends
+            "timestamp": timestamp,
+            "gpu": dict(
+                _gpu_fields(gpu_metrics),
+                is_simulated=gpu_metrics.is_simulated,
+                device_count=gpu_metrics.device_count
+            ),
+            "gpus": [dict(_gpu_fields(device), index=device.index) for device in devices],
+            "carbon": {
+                "intensity_g_per_kwh": round(carbon_data.carbon_intensity_g_per_kwh, 1),
+                "is_mocked": carbon_data.is_mocked,
+                "is_stale": carbon_data.is_stale,
+                "region": carbon_data.region,
+                "emissions_g_per_second": round(carbon_data.emissions_grams_per_second, 6),
+                "emissions_g_per_minute": round(carbon_data.emissions_grams_per_second * 60, 4),
+                "emissions_total_g": round(carbon_data.emissions_grams_total, 4),
+                "suggestion": carbon_data.suggestion
+            },
+            "job": {
+                "id": job.job_id if job else None,
+                "active_jobs": len(self.calculator.jobs.active()),
+                "running": job is not None,
+                "runtime_seconds": round(self.calculator.get_runtime_hours() * 3600, 1),
+                "energy_wh": round(energy["energy_wh"], 6),
+                "energy_source": energy["source"],
+                "energy_error_wh": round(energy["error_estimate_wh"], 6),
+                "energy_drift_wh": None if energy["drift_wh"] is None else round(energy["drift_wh"], 6)
+            }
+        }
+
+        # Serialize once; /metrics and the stream reuse these bytes (history stays columnar)
+        encoded = dumps(snapshot)
+
+        with self._lock:
+            position = self.history.append(snapshot)
+            if self.store is not None:
+                self.store.append(snapshot)  # Only enqueues; the store's writer thread inserts
+            self.rollups.add(snapshot)
+            self.sample_count += 1
+            # Publish last so readers never see a snapshot missing from history
+            self._latest = snapshot
+            self._latest_encoded = encoded
+
+        # Render per-tick outputs outside the lock so they never delay readers
+        self.prometheus.update(snapshot, self.calculator, self.sample_count)
+        self.broadcaster.publish(encoded, event_id=position)
+        return snapshot
+
+    def _run(self):
+        """Sampling loop scheduled against absolute deadlines to avoid drift"""
+        next_deadline = time.monotonic() + self.interval
+        while not self._stop_event.wait(max(0.0, next_deadline - time.monotonic())):
+            try:
+                self.sample_once()
+            except Exception as e:
+                print(f"⚠ Sampler error: {e}")
+            next_deadline += self.interval
+            # Skip missed ticks instead of bursting to catch up
+            now = time.monotonic()
+            if next_deadline < now:
+                next_deadline = now + self.interval
+
+
+# Singleton instance
+_sampler: Optional[MetricsSampler] = None
+
+
+def get_sampler(
+    monitor: GPUMonitor,
+    calculator: CarbonCalculator,
+    hz: float = DEFAULT_SAMPLE_HZ,
+    max_history: int = DEFAULT_MAX_HISTORY,
+    store: Optional[SQLiteStore] = None,
+    rollups: Optional[Downsampler] = None
+) -> MetricsSampler:
+    """Get or create the global metrics sampler instance"""
+    global _sampler
+    if _sampler is None:
+        _sampler = MetricsSampler(
+            monitor, calculator, hz=hz, max_history=max_history, store=store, rollups=rollups
+        )
+    return _sampler
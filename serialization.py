@@ -0,0 +1,23 @@
+"""
+Serialization - EcoCompute AI / GreenGL
+Compact JSON encoding with an optional fast encoder
+"""
+
+import json
+from typing import Any
+
+# Try to import orjson (optional, several times faster), fall back to the stdlib
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+JSON_MIMETYPE = "application/json"
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode an object as compact UTF-8 JSON"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
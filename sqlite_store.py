@@ -0,0 +1,556 @@
+"""
+SQLite History - EcoCompute AI / GreenGL
+Persistent time-series store with WAL mode and batched background inserts
+"""
+
+import math
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from rollups import ROLLUP_COLUMNS, Downsampler
+from running_stats import RunningStats
+from timeseries import (
+    CATEGORY, DEVICE_SCHEMA, DEVICE_SECTION, OBJECT, SCHEMA, TRACKED_COLUMNS, Column, dictionary_encode
+)
+
+DEFAULT_BATCH_SIZE = 100  # Samples per insert transaction
+DEFAULT_FLUSH_INTERVAL = 1.0  # Max seconds a sample waits before being written
+DEFAULT_QUEUE_SIZE = 100000  # Samples buffered before new ones are dropped
+DEFAULT_RETENTION = 24 * 3600  # Seconds of raw samples kept (rollup tiers keep longer)
+PRUNE_INTERVAL = 60.0  # Seconds between retention sweeps
+
+_SQL_TYPES = {CATEGORY: "TEXT", OBJECT: "TEXT", "bool": "INTEGER", "uint16": "INTEGER"}
+
+
+def _sql_type(column: Column) -> str:
+    return _SQL_TYPES.get(column.dtype, "REAL")
+
+
+def _from_sql(column: Column, value: Any) -> Any:
+    """Convert a stored value back to its snapshot form"""
+    if value is None or column.dtype in (CATEGORY, OBJECT):
+        return value
+    if column.dtype == "bool":
+        return bool(value)
+    if column.dtype == "uint16":
+        return int(value)
+    return value if column.decimals is None else round(value, column.decimals)
+
+
+def _from_sql_float(value: float, places: Optional[int]) -> float:
+    return value if places is None else round(value, places)
+
+
+class SQLiteStore:
+    """
+    Persistent metric history in a SQLite database.
+
+    Exposes the same read API as TimeSeriesStore (absolute positions,
+    positions_between, get_positions, aggregate, running_stats), so routes
+    work against either store. append() only enqueues the snapshot; a writer
+    thread inserts queued samples in one transaction per batch, and WAL mode
+    lets request threads read while it writes. Raw samples older than
+    `retention` seconds are deleted; closed rollup buckets are kept in one
+    table per tier with their own retention (`rollup_retention`).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        retention: Optional[float] = DEFAULT_RETENTION,
+        rollup_retention: Optional[Dict[str, float]] = None,
+        schema: List[Column] = SCHEMA,
+        device_schema: List[Column] = DEVICE_SCHEMA,
+        tracked: tuple = TRACKED_COLUMNS
+    ):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.schema = schema
+        self.device_schema = device_schema
+        self.tracked = tracked
+        self.retention = retention  # None keeps raw samples forever
+        self.rollup_retention = dict(rollup_retention or {})
+        self._last_prune = 0.0
+        self.dropped = 0  # Samples discarded because the write queue was full
+        # Items are (None, snapshot) for raw samples or (tier, row) for closed rollup buckets
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=DEFAULT_QUEUE_SIZE)
+        self._writer = self._connect()
+        self._create_tables()
+        self._next_position = self._writer.execute(
+            "SELECT COALESCE(MAX(position) + 1, 0) FROM samples"
+        ).fetchone()[0]
+        # Aggregates of the tracked columns over all stored rows, maintained by the writer thread
+        self._stats_lock = threading.Lock()
+        self._seed_running_stats()
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints, safe with WAL
+        return connection
+
+    def _create_tables(self):
+        columns = ", ".join(f"{column.name} {_sql_type(column)}" for column in self.schema)
+        device_columns = ", ".join(f"{column.name} {_sql_type(column)}" for column in self.device_schema)
+        with self._writer:
+            self._writer.execute(f"CREATE TABLE IF NOT EXISTS samples (position INTEGER PRIMARY KEY, {columns})")
+            self._writer.execute("CREATE INDEX IF NOT EXISTS idx_samples_timestamp ON samples (timestamp)")
+            self._writer.execute(
+                f"CREATE TABLE IF NOT EXISTS device_samples (position INTEGER, device_index INTEGER, "
+                f"{device_columns}, PRIMARY KEY (position, device_index)) WITHOUT ROWID"
+            )
+            rollup_columns = ", ".join(
+                f"{name} {'INTEGER' if dtype == 'uint32' else 'REAL'}" for name, dtype in ROLLUP_COLUMNS[1:]
+            )
+            for tier in self.rollup_retention:
+                self._writer.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self._rollup_table(tier)} (timestamp REAL PRIMARY KEY, {rollup_columns})"
+                )
+
+    @staticmethod
+    def _rollup_table(tier: str) -> str:
+        return f"rollup_{tier}"
+
+    # Writing
+
+    def append(self, snapshot: dict):
+        """Queue a snapshot for the writer thread (never blocks the caller)"""
+        try:
+            self._queue.put_nowait((None, snapshot))
+        except queue.Full:
+            self.dropped += 1
+
+    def append_rollup(self, tier: str, bucket: Dict[str, float]):
+        """Queue a closed rollup bucket (Downsampler on_close hook)"""
+        if tier in self.rollup_retention:
+            try:
+                self._queue.put_nowait((tier, dict(bucket)))
+            except queue.Full:
+                self.dropped += 1
+
+    def _run(self):
+        """Writer loop: wait for a sample, gather a batch, insert it in one transaction"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._insert(batch)
+                self._prune()
+            except sqlite3.Error as e:
+                print(f"⚠ History write failed ({len(batch)} samples): {e}")
+            if stop:
+                return
+
+    def _insert(self, batch: List[tuple]):
+        rows, device_rows = [], []
+        rollup_rows: Dict[str, List[list]] = {}
+        for tier, item in batch:
+            if tier is not None:
+                rollup_rows.setdefault(tier, []).append([item[name] for name, _ in ROLLUP_COLUMNS])
+                continue
+            snapshot = item
+            # Keep the sampler's sequence number as the position, so both stores agree
+            position = snapshot.get("seq", self._next_position)
+            self._next_position = position + 1
+            rows.append([position] + [
+                snapshot[column.key] if column.section is None else snapshot[column.section][column.key]
+                for column in self.schema
+            ])
+            for device in snapshot.get(DEVICE_SECTION, []):
+                device_rows.append([position, device["index"]] + [
+                    device[column.key] for column in self.device_schema
+                ])
+        placeholders = ", ".join("?" * (len(self.schema) + 1))
+        device_placeholders = ", ".join("?" * (len(self.device_schema) + 2))
+        rollup_placeholders = ", ".join("?" * len(ROLLUP_COLUMNS))
+        with self._writer:
+            if rows:
+                self._writer.executemany(f"INSERT INTO samples VALUES ({placeholders})", rows)
+            if device_rows:
+                self._writer.executemany(
+                    f"INSERT INTO device_samples VALUES ({device_placeholders})", device_rows
+                )
+            for tier, tier_rows in rollup_rows.items():
+                self._writer.executemany(
+                    f"INSERT OR REPLACE INTO {self._rollup_table(tier)} VALUES ({rollup_placeholders})", tier_rows
+                )
+        if rows:
+            self._add_running_stats(rows)
+
+    def _prune(self):
+        """Delete rows past their retention, at most once per PRUNE_INTERVAL"""
+        now = time.time()
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        with self._writer:
+            if self.retention is not None:
+                row = self._writer.execute(
+                    "SELECT position FROM samples WHERE timestamp >= ? ORDER BY timestamp, position LIMIT 1",
+                    (now - self.retention,)
+                ).fetchone()
+                cutoff = row[0] if row else self._next_position
+                pruned = self._writer.execute(
+                    f"SELECT {', '.join(self._stats_names)} FROM samples WHERE position < ?", (cutoff,)
+                ).fetchall()
+                self._writer.execute("DELETE FROM samples WHERE position < ?", (cutoff,))
+                self._writer.execute("DELETE FROM device_samples WHERE position < ?", (cutoff,))
+            for tier, retention in self.rollup_retention.items():
+                self._writer.execute(
+                    f"DELETE FROM {self._rollup_table(tier)} WHERE timestamp < ?", (now - retention,)
+                )
+        if self.retention is not None and pruned:
+            self._remove_running_stats(pruned)
+
+    # Running aggregates (updated by the writer thread, read in O(1) by running_stats)
+
+    @property
+    def _stats_names(self) -> List[str]:
+        return ["timestamp"] + list(self.tracked)
+
+    def _seed_running_stats(self):
+        """Aggregate the rows currently stored (at startup, or after pruning most of them)"""
+        aggregates = self.aggregate(self._stats_names)
+        count = aggregates["timestamp"]["count"]
+        with self._stats_lock:
+            self._count = count
+            self._running = {
+                name: RunningStats.from_moments(count, aggregates[name]["avg"] or 0.0,
+                                                (aggregates[name]["stddev"] or 0.0) ** 2)
+                for name in self.tracked
+            }
+            self._extrema = {name: [aggregates[name]["min"], aggregates[name]["max"]] for name in self.tracked}
+            self._first = {name: aggregates[name]["first"] for name in self._stats_names} if count else None
+            self._last = {name: aggregates[name]["last"] for name in self._stats_names} if count else None
+
+    def _add_running_stats(self, rows: List[list]):
+        """Fold newly inserted sample rows ([position] + schema values) into the aggregates"""
+        indices = {column.name: i + 1 for i, column in enumerate(self.schema)}
+        with self._stats_lock:
+            for row in rows:
+                values = {name: row[indices[name]] for name in self._stats_names}
+                for name in self.tracked:
+                    self._running[name].add(values[name])
+                    extrema = self._extrema[name]
+                    extrema[0] = values[name] if extrema[0] is None else min(extrema[0], values[name])
+                    extrema[1] = values[name] if extrema[1] is None else max(extrema[1], values[name])
+                if self._first is None:
+                    self._first = values
+                self._last = values
+                self._count += 1
+
+    def _remove_running_stats(self, pruned: List[tuple]):
+        """
+        Take pruned rows (timestamp + tracked values) out of the aggregates.
+        Min/max can't be un-folded, so a column whose extreme was pruned is
+        re-aggregated once here, on the writer thread. When most rows were
+        pruned, re-aggregating the rest is cheaper and avoids rounding drift.
+        """
+        if 2 * len(pruned) >= self._count:
+            self._seed_running_stats()
+            return
+        stale = set()
+        with self._stats_lock:
+            for row in pruned:
+                for name, value in zip(self.tracked, row[1:]):
+                    self._running[name].remove(value)
+                    if value <= self._extrema[name][0] or value >= self._extrema[name][1]:
+                        stale.add(name)
+            self._count -= len(pruned)
+        first = self._writer.execute(
+            f"SELECT {', '.join(self._stats_names)} FROM samples ORDER BY position LIMIT 1"
+        ).fetchone()
+        refreshed = {}
+        if stale and first is not None:
+            names = sorted(stale)
+            values = self._writer.execute(
+                f"SELECT {', '.join(f'MIN({name}), MAX({name})' for name in names)} FROM samples"
+            ).fetchone()
+            refreshed = {name: list(values[2 * i:2 * i + 2]) for i, name in enumerate(names)}
+        with self._stats_lock:
+            self._extrema.update(refreshed)
+            if first is None:
+                self._count = 0
+                self._first = self._last = None
+                for name in self.tracked:
+                    self._running[name].reset()
+                    self._extrema[name] = [None, None]
+            else:
+                self._first = dict(zip(self._stats_names, first))
+
+    def load_rollups(self, tier: str) -> List[Dict[str, float]]:
+        """Closed buckets of a tier within its retention, oldest first"""
+        if tier not in self.rollup_retention:
+            return []
+        with self._reader() as db:
+            rows = db.execute(
+                f"SELECT * FROM {self._rollup_table(tier)} WHERE timestamp >= ? ORDER BY timestamp",
+                (time.time() - self.rollup_retention[tier],)
+            ).fetchall()
+        return [dict(zip((name for name, _ in ROLLUP_COLUMNS), row)) for row in rows]
+
+    def restore_rollups(self, downsampler: Downsampler):
+        """
+        Reload a downsampler after a restart: closed buckets of every tier
+        (finest first, which also rebuilds the coarser open buckets), then the
+        raw samples of the finest bucket that was still open at shutdown.
+        """
+        for tier in downsampler.tiers:
+            downsampler.restore(tier.spec.name, self.load_rollups(tier.spec.name))
+        end = self.end_position
+        newest = self.get_positions(end - 1, end)
+        if not newest:
+            return
+        seconds = downsampler.tiers[0].spec.seconds
+        start, stop = self.positions_between(newest[0]["timestamp"] // seconds * seconds, None)
+        for snapshot in self.get_positions(start, stop):
+            downsampler.add(snapshot)
+
+    def close(self, timeout: Optional[float] = None):
+        """Write everything still queued and close the database"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._writer.close()
+
+    # Reading (each call uses its own connection, so any thread may read)
+
+    def _reader(self) -> "closing[sqlite3.Connection]":
+        return closing(sqlite3.connect(self.path))
+
+    @property
+    def start_position(self) -> int:
+        with self._reader() as db:
+            return db.execute("SELECT COALESCE(MIN(position), 0) FROM samples").fetchone()[0]
+
+    @property
+    def end_position(self) -> int:
+        with self._reader() as db:
+            return db.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM samples").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._reader() as db:
+            return db.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+
+    def positions_between(
+        self,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None
+    ):
+        """
+        Positions [start, stop) of samples with start_time <= timestamp <= end_time.
+
+        Timestamps never decrease with position, so each given bound is one
+        seek in the timestamp index; an empty window is (start, start).
+        """
+        with self._reader() as db:
+            # Separate subqueries so each is a single b-tree seek (MIN and MAX together scan)
+            first, end = db.execute(
+                "SELECT COALESCE((SELECT MIN(position) FROM samples), 0), "
+                "COALESCE((SELECT MAX(position) FROM samples) + 1, 0)"
+            ).fetchone()
+            start, stop = first, end
+            if start_time is not None:
+                row = db.execute(
+                    "SELECT position FROM samples WHERE timestamp >= ? ORDER BY timestamp, position LIMIT 1",
+                    (start_time,)
+                ).fetchone()
+                start = row[0] if row else end
+            if end_time is not None:
+                row = db.execute(
+                    "SELECT position FROM samples WHERE timestamp <= ? ORDER BY timestamp DESC, position DESC LIMIT 1",
+                    (end_time,)
+                ).fetchone()
+                stop = row[0] + 1 if row else first
+        return start, max(start, stop)
+
+    def get_positions(self, start: int, stop: int) -> List[Dict[str, Any]]:
+        """Rebuild the snapshots at positions [start, stop)"""
+        names = ", ".join(column.name for column in self.schema)
+        device_names = ", ".join(column.name for column in self.device_schema)
+        with self._reader() as db:
+            rows = db.execute(
+                f"SELECT position, {names} FROM samples WHERE position >= ? AND position < ? ORDER BY position",
+                (start, stop)
+            ).fetchall()
+            device_rows = db.execute(
+                f"SELECT position, device_index, {device_names} FROM device_samples "
+                f"WHERE position >= ? AND position < ? ORDER BY position, device_index",
+                (start, stop)
+            ).fetchall()
+
+        devices: Dict[int, List[dict]] = {}
+        for position, index, *values in device_rows:
+            device = {column.key: _from_sql(column, value) for column, value in zip(self.device_schema, values)}
+            device["index"] = index
+            devices.setdefault(position, []).append(device)
+
+        records = []
+        for position, *values in rows:
+            record: Dict[str, Any] = {"seq": position, "gpu": {}, "carbon": {}, "job": {}}
+            for column, value in zip(self.schema, values):
+                value = _from_sql(column, value)
+                if column.section is None:
+                    record[column.key] = value
+                else:
+                    record[column.section][column.key] = value
+            record[DEVICE_SECTION] = devices.get(position, [])
+            record["gpu"]["device_count"] = len(record[DEVICE_SECTION])
+            record["carbon"]["emissions_g_per_minute"] = round(
+                record["carbon"]["emissions_g_per_second"] * 60, 4
+            )
+            records.append(record)
+        return records
+
+    def column(self, name: str, start: Optional[int] = None, stop: Optional[int] = None) -> np.ndarray:
+        """One column for positions [start, stop) in time order"""
+        column = next(column for column in self.schema if column.name == name)
+        bounds = (-1 if start is None else start, math.inf if stop is None else stop)
+        with self._reader() as db:
+            rows = db.execute(
+                f"SELECT {name} FROM samples WHERE position >= ? AND position < ? ORDER BY position", bounds
+            ).fetchall()
+        dtype = np.float64 if column.nullable else column.dtype
+        return np.array([row[0] for row in rows], dtype=dtype)
+
+    def export_columns(
+        self,
+        start: Optional[int] = None,
+        stop: Optional[int] = None,
+        names: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        The columns `names` (default: all) for positions [start, stop), in the same
+        layout as TimeSeriesStore.export_columns (category columns as (codes, categories)).
+        """
+        bounds = (-1 if start is None else start, math.inf if stop is None else stop)
+        schema = [column for column in self.schema if names is None or column.name in names]
+        device_schema = [column for column in self.device_schema if names is None or column.name in names]
+        with self._reader() as db:
+            rows = db.execute(
+                f"SELECT {', '.join(['position'] + [column.name for column in schema])} FROM samples "
+                f"WHERE position >= ? AND position < ? ORDER BY position", bounds
+            ).fetchall()
+            device_rows = db.execute(
+                f"SELECT {', '.join(['position', 'device_index'] + [column.name for column in device_schema])} "
+                f"FROM device_samples WHERE position >= ? AND position < ? ORDER BY device_index, position", bounds
+            ).fetchall() if device_schema else []
+
+        values = list(zip(*rows)) or [()] * (len(schema) + 1)
+        positions = np.array(values[0], dtype=np.int64)
+        result: Dict[str, Any] = {"seq": positions}
+        for column, data in zip(schema, values[1:]):
+            result[column.name] = self._export_column(column, list(data))
+
+        # Pivot device rows into one column per GPU, aligned to the sample positions
+        by_device: Dict[int, List[tuple]] = {}
+        for row in device_rows:
+            by_device.setdefault(row[1], []).append(row)
+        slots = {index: np.searchsorted(positions, [row[0] for row in device]) for index, device in by_device.items()}
+        for offset, column in enumerate(device_schema, start=2):
+            for index, device in sorted(by_device.items()):
+                data = [None] * len(positions)
+                for slot, row in zip(slots[index], device):
+                    data[slot] = row[offset]
+                result[f"{column.name}_{index}"] = self._export_column(column, data)
+        return result
+
+    @staticmethod
+    def _export_column(column: Column, data: List[Any]):
+        """Convert one column of SQL values to its export form"""
+        if column.dtype in (CATEGORY, OBJECT):
+            return dictionary_encode(data)
+        if column.dtype in ("bool", "uint16"):
+            return np.array([value or 0 for value in data], dtype=column.dtype)
+        return np.array([np.nan if value is None else value for value in data], dtype=column.dtype)
+
+    def aggregate(
+        self,
+        names: List[str],
+        start: Optional[int] = None,
+        stop: Optional[int] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """Count/min/max/mean/stddev and first/last values of numeric columns over [start, stop)"""
+        decimals = {column.name: column.decimals for column in self.schema}
+        bounds = (-1 if start is None else start, math.inf if stop is None else stop)
+        where = "WHERE position >= ? AND position < ?"
+        expressions = ", ".join(f"MIN({name}), MAX({name}), AVG({name}), AVG({name} * {name})" for name in names)
+        with self._reader() as db:
+            count, first, last, *values = db.execute(
+                f"SELECT COUNT(*), MIN(position), MAX(position), {expressions} FROM samples {where}", bounds
+            ).fetchone()
+            edges = db.execute(
+                f"SELECT {', '.join(names)} FROM samples WHERE position IN (?, ?) ORDER BY position",
+                (first, last)
+            ).fetchall() if count else []
+
+        result = {}
+        for i, name in enumerate(names):
+            if count == 0:
+                result[name] = {"count": 0, "min": None, "max": None, "avg": None,
+                                "stddev": None, "first": None, "last": None}
+                continue
+            minimum, maximum, mean, mean_square = values[4 * i:4 * i + 4]
+            places = decimals.get(name)
+            result[name] = {
+                "count": count,
+                "min": minimum if places is None else round(minimum, places),
+                "max": maximum if places is None else round(maximum, places),
+                "avg": mean,
+                "stddev": math.sqrt(max(0.0, mean_square - mean * mean)),
+                "first": edges[0][i],
+                "last": edges[-1][i]
+            }
+        return result
+
+    def running_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        O(1) aggregates of the tracked columns over the whole stored history,
+        in the same layout as TimeSeriesStore.running_stats.
+        """
+        decimals = {column.name: column.decimals for column in self.schema}
+        with self._stats_lock:
+            result: Dict[str, Dict[str, Any]] = {"timestamp": {
+                "count": self._count,
+                "first": self._first["timestamp"] if self._count else None,
+                "last": self._last["timestamp"] if self._count else None
+            }}
+            for name in self.tracked:
+                running, places = self._running[name], decimals.get(name)
+                if self._count == 0:
+                    result[name] = {"count": 0, "min": None, "max": None, "avg": None,
+                                    "stddev": None, "first": None, "last": None}
+                    continue
+                result[name] = {
+                    "count": self._count,
+                    "min": _from_sql_float(self._extrema[name][0], places),
+                    "max": _from_sql_float(self._extrema[name][1], places),
+                    "avg": running.mean,
+                    "stddev": running.stddev,
+                    "first": self._first[name],
+                    "last": self._last[name]
+                }
+        return result
@@ -0,0 +1,12 @@
+"""
+Test Configuration - EcoCompute AI / GreenGL
+Puts the top-level modules on the path and configures the app before any test imports it
+"""
+
+import os
+import sys
+
+# Sample fast so many intervals are integrated while requests are in flight
+os.environ.setdefault("SAMPLE_RATE_HZ", "100")
+os.environ.pop("HISTORY_DB_PATH", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,79 @@
+"""
+Carbon Tests - EcoCompute AI / GreenGL
+Intensity caching against a local stand-in for the Electricity Maps API
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from carbon_utils import CarbonCalculator, create_session
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Answers with the class's current status and intensity, counting calls"""
+
+    status = 200
+    intensity = 123
+    calls = 0
+
+    def do_GET(self):
+        StandIn.calls += 1
+        body = json.dumps({"carbonIntensity": StandIn.intensity}).encode("utf-8")
+        self.send_response(StandIn.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_url():
+    StandIn.status, StandIn.calls = 200, 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def _wait_for_calls(count, timeout=5.0):
+    deadline = time.time() + timeout
+    while StandIn.calls < count and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)  # Let the refresh store its result
+
+
+def test_failed_refresh_keeps_the_last_real_reading(api_url):
+    calculator = CarbonCalculator(
+        api_key="test", cache_ttl=0.05, api_url=api_url, session=create_session(max_retries=0)
+    )
+    reading = calculator.get_reading("DE")
+    assert (reading.intensity, reading.is_mocked) == (123, False)
+
+    StandIn.status = 503
+    time.sleep(0.1)  # Past the TTL
+    stale = calculator.get_reading("DE", wait=False)  # Schedules the refresh, which fails
+    assert (stale.intensity, stale.is_mocked, stale.is_stale) == (123, False, True)
+    _wait_for_calls(2)
+
+    for wait in (False, True):
+        reading = calculator.get_reading("DE", wait=wait)
+        assert (reading.intensity, reading.is_mocked, reading.is_stale) == (123, False, True)
+        assert reading.region == "DE"
+    assert StandIn.calls == 2  # Backing off: no retry before refresh_retry
+
+
+def test_failed_cold_fetch_is_mocked(api_url):
+    StandIn.status = 503
+    calculator = CarbonCalculator(api_key="test", api_url=api_url, session=create_session(max_retries=0))
+    reading = calculator.get_reading("DE")
+    assert reading.is_mocked
+    assert reading.region == "Mocked (DE)"
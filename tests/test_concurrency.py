@@ -0,0 +1,131 @@
+"""
+Concurrency Tests - EcoCompute AI / GreenGL
+Hammer the API from many threads while the sampler writes and check its invariants
+"""
+
+import threading
+import time
+
+import app as app_module
+from timeseries import TimeSeriesStore
+
+THREADS = 64
+REQUESTS_PER_THREAD = 50
+TOLERANCE_WH = 1e-9
+
+
+def _overlap_wh(interval, start_time, end_time) -> float:
+    """Energy of the part of an interval that falls inside [start_time, end_time]"""
+    overlap = min(interval.end_time, end_time) - max(interval.start_time, start_time)
+    if overlap <= 0:
+        return 0.0
+    return interval.energy_wh * min(1.0, overlap / (interval.end_time - interval.start_time))
+
+
+def _record_node_intervals(calculator):
+    """Wrap the node meter so every interval it measures is also appended to a list"""
+    intervals = []
+    meter = calculator.node_meter
+    update = meter.update
+
+    def recording_update(*args, **kwargs):
+        interval = update(*args, **kwargs)
+        if interval is not None:
+            intervals.append(interval)
+        return interval
+
+    with calculator._lock:
+        total_before = meter.total_wh
+        meter.update = recording_update
+    return intervals, total_before
+
+
+def _hammer(client, errors, barrier):
+    barrier.wait()
+    for i in range(REQUESTS_PER_THREAD):
+        # Alternate the sampler's snapshot with re-pricing for another zone
+        response = client.get("/metrics?region=GB" if i % 4 == 0 else "/metrics")
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+
+def test_metrics_under_load_conserves_energy():
+    calculator = app_module.carbon_calc
+    intervals, total_before = _record_node_intervals(calculator)
+    try:
+        client = app_module.app.test_client()
+        job_id = client.post("/job/start", json={"name": "stress"}).get_json()["job_id"]
+
+        errors = []
+        barrier = threading.Barrier(THREADS)
+        threads = [
+            threading.Thread(target=_hammer, args=(app_module.app.test_client(), errors, barrier))
+            for _ in range(THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        time.sleep(0.1)  # Let the sampler integrate a few more intervals
+
+        summary = client.post(f"/job/{job_id}/stop").get_json()["summary"]
+        assert not errors, f"non-200 responses: {errors[:10]}"
+
+        with calculator._lock:
+            job = calculator.jobs.get(job_id)
+            recorded = list(intervals)
+            total_after = calculator.node_meter.total_wh
+    finally:
+        calculator.node_meter.__dict__.pop("update", None)
+
+    assert len(recorded) > 10
+
+    # Intervals tile time: none overlaps or repeats another, so nothing is integrated twice
+    for previous, interval in zip(recorded, recorded[1:]):
+        assert interval.start_time == previous.end_time
+        assert interval.end_time > interval.start_time
+
+    # The meter's total grew by exactly the intervals it handed out
+    assert abs((total_after - total_before) - sum(i.energy_wh for i in recorded)) < TOLERANCE_WH
+
+    # The job holds exactly its share of those intervals, including the final partial one
+    expected_wh = sum(_overlap_wh(interval, job.start_time, job.end_time) for interval in recorded)
+    assert job.energy_wh > 0
+    assert abs(job.energy_wh - expected_wh) < TOLERANCE_WH
+    assert summary["total_energy_wh"] == round(job.energy_wh, 4)
+
+
+def test_lttb_while_the_ring_wraps(monkeypatch):
+    """Downsampling a full ring that evicts between reads keeps every series aligned"""
+    template = app_module.sampler.latest() or app_module.sampler.sample_once()
+    ring = TimeSeriesStore(200, device_count=app_module.gpu_monitor.device_count)
+
+    def append(offset):
+        ring.append(dict(template, timestamp=template["timestamp"] + offset * 1e-3))
+
+    for offset in range(200):
+        append(offset)
+    monkeypatch.setattr(app_module, "history_store", ring)
+
+    done = threading.Event()
+
+    def write():
+        offset = 200
+        while not done.is_set():
+            append(offset)
+            offset += 1
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        client = app_module.app.test_client()
+        for _ in range(200):
+            response = client.get("/history?points=50")
+            assert response.status_code == 200
+            body = response.get_json()
+            # Rows evicted after the window was located are gone, but every series must agree
+            for name, points in body["series"].items():
+                assert len(points["timestamps"]) == len(points["values"]) == min(50, body["count"]), name
+    finally:
+        done.set()
+        writer.join()
@@ -0,0 +1,52 @@
+"""
+History Tests - EcoCompute AI / GreenGL
+Conditional requests against /history while the sampler keeps ticking
+"""
+
+import time
+
+import app as app_module
+
+
+def _wait_for_samples(count, timeout=5.0):
+    deadline = time.time() + timeout
+    while len(app_module.sampler.history) < count and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def _wait_for_tick():
+    sequence = app_module.sampler.history.end_position
+    deadline = time.time() + 5.0
+    while app_module.sampler.history.end_position == sequence and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_closed_window_revalidates_after_a_tick():
+    _wait_for_samples(50)
+    client = app_module.app.test_client()
+    timestamps = app_module.history_store.column("timestamp")
+    url = f"/history?start_time={timestamps[-40]}&end_time={timestamps[-20]}"
+
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.get_json()["resolution"] == "raw"
+    _wait_for_tick()
+
+    again = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == first.headers["ETag"]
+
+
+def test_open_window_changes_with_each_tick():
+    _wait_for_samples(50)
+    client = app_module.app.test_client()
+    start_time = app_module.history_store.column("timestamp")[-20]
+    url = f"/history?start_time={start_time}&end_time={time.time() + 3600}"
+
+    first = client.get(url)
+    assert first.status_code == 200
+    _wait_for_tick()
+
+    again = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 200
+    assert again.headers["ETag"] != first.headers["ETag"]
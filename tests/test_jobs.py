@@ -0,0 +1,34 @@
+"""
+Job Tests - EcoCompute AI / GreenGL
+Finished ledgers are pruned by when they ended, never before their final interval
+"""
+
+import time
+
+from energy import IntervalEnergy
+from jobs import JobTracker
+
+
+def _interval(start_time, end_time, energy_wh=1.0):
+    return IntervalEnergy(start_time, end_time, energy_wh, energy_wh, None, 0.0)
+
+
+def test_long_job_outlives_newer_short_jobs():
+    tracker = JobTracker(max_finished=3)
+    long_job = tracker.start(name="long")
+    start = time.time()
+    tracker.record(_interval(start - 1, start), {}, 100.0)
+
+    for _ in range(4):
+        tracker.stop(tracker.start().job_id)
+        tracker.record(_interval(start, time.time()), {}, 100.0)
+        start = time.time()
+
+    tracker.stop(long_job.job_id)
+    assert tracker.get(long_job.job_id) is long_job  # Still owed its final interval
+
+    before = long_job.energy_wh
+    tracker.record(_interval(start, time.time() + 1), {}, 100.0)
+    assert tracker.get(long_job.job_id) is long_job  # Ended last, so kept over the short jobs
+    assert long_job.energy_wh > before
+    assert len([job for job in tracker.all() if not job.running]) == 3
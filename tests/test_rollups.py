@@ -0,0 +1,50 @@
+"""
+Rollup Tests - EcoCompute AI / GreenGL
+Persisted rollups keep the bucket a restart falls in whole
+"""
+
+import time
+
+import app as app_module
+from rollups import DEFAULT_TIERS, Downsampler
+from sqlite_store import SQLiteStore
+
+POWER_WATTS = 200.0
+
+
+def _run(path, template, first, last):
+    """One process lifetime: restore, sample at 1 Hz over [first, last), shut down"""
+    store = SQLiteStore(path, rollup_retention={tier.name: tier.retention_seconds for tier in DEFAULT_TIERS})
+    downsampler = Downsampler(DEFAULT_TIERS, on_close=store.append_rollup)
+    store.restore_rollups(downsampler)
+    seq = store.end_position
+    for timestamp in range(first, last):
+        snapshot = dict(template, seq=seq, timestamp=float(timestamp),
+                        gpu=dict(template["gpu"], power_watts=POWER_WATTS))
+        store.append(snapshot)
+        downsampler.add(snapshot)
+        seq += 1
+    store.close()
+
+
+def test_restart_keeps_the_open_hour(tmp_path):
+    template = app_module.sampler.latest() or app_module.sampler.sample_once()
+    path = str(tmp_path / "history.db")
+    hour = int(time.time()) // 3600 * 3600 - 3600  # The last complete hour
+
+    # Restart half way through the hour, mid-minute
+    _run(path, template, hour, hour + 1830)
+    _run(path, template, hour + 1830, hour + 3661)  # Closes the next hour's first minute, and so this hour
+
+    store = SQLiteStore(path, rollup_retention={tier.name: tier.retention_seconds for tier in DEFAULT_TIERS})
+    try:
+        bucket = next(row for row in store.load_rollups("1h") if row["timestamp"] == hour)
+        minute = next(row for row in store.load_rollups("1m") if row["timestamp"] == hour + 1800)
+    finally:
+        store.close()
+
+    assert bucket["count"] == 3600
+    assert minute["count"] == 60
+    # 3599 one-second intervals at 200 W (the first sample has no previous one),
+    # less the interval the restart itself may not bridge
+    assert abs(bucket["energy_wh"] - POWER_WATTS) < 2 * POWER_WATTS / 3600
@@ -0,0 +1,41 @@
+"""
+Wire Format Tests - EcoCompute AI / GreenGL
+Binary encodings agree with JSON on missing values
+"""
+
+import numpy as np
+import pytest
+
+import app as app_module
+from timeseries import TimeSeriesStore
+from wire import encode_arrow, encode_msgpack, iter_parquet
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+msgpack = pytest.importorskip("msgpack")
+
+
+@pytest.fixture
+def columns():
+    template = app_module.sampler.latest() or app_module.sampler.sample_once()
+    store = TimeSeriesStore(4, device_count=app_module.gpu_monitor.device_count)
+    for offset, drift in enumerate([0.25, None, 0.5]):
+        store.append(dict(template, timestamp=template["timestamp"] + offset,
+                          job=dict(template["job"], energy_drift_wh=drift)))
+    assert [record["job"]["energy_drift_wh"] for record in store.get_positions(0, 3)] == [0.25, None, 0.5]
+    exported = store.export_columns(names=["timestamp", "energy_drift_wh"])
+    assert np.isnan(exported["energy_drift_wh"][1])
+    return exported
+
+
+def test_missing_floats_are_null_in_every_format(columns):
+    expected = [0.25, None, 0.5]
+
+    table = pa.ipc.open_stream(encode_arrow(columns)).read_all()
+    assert table.column("energy_drift_wh").to_pylist() == expected
+
+    parquet = pq.read_table(pa.BufferReader(b"".join(iter_parquet([columns]))))
+    assert parquet.column("energy_drift_wh").to_pylist() == expected
+
+    unpacked = msgpack.unpackb(encode_msgpack(columns))
+    assert unpacked["columns"]["energy_drift_wh"] == expected
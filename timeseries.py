@@ -0,0 +1,382 @@
+"""
+Time-Series Store - EcoCompute AI / GreenGL
+Columnar NumPy-backed history of GPU and carbon samples
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ring_buffer import RingBuffer
+from running_stats import RunningStats, SlidingExtrema
+
+CATEGORY = "category"  # Dictionary-encoded string column (few distinct values)
+OBJECT = "object"  # Per-row Python value, for strings with unbounded distinct values
+
+
+@dataclass(frozen=True)
+class Column:
+    """Maps one field of a metrics snapshot to a typed column"""
+    name: str
+    section: Optional[str]  # Nested snapshot section ("gpu", "carbon", "job") or None
+    key: str
+    dtype: str
+    decimals: Optional[int] = None  # Rounding applied when materializing records
+    nullable: bool = False  # None is stored as NaN (float columns only)
+
+
+# Columns with incrementally maintained aggregates
+TRACKED_COLUMNS = ("power_watts", "utilization_percent", "emissions_total_g")
+
+# Column layout of a metrics snapshot (see MetricsSampler.sample_once)
+SCHEMA = [
+    Column("timestamp", None, "timestamp", "float64"),
+    Column("gpu_name", "gpu", "name", CATEGORY),
+    Column("power_watts", "gpu", "power_watts", "float32", 2),
+    Column("temperature_celsius", "gpu", "temperature_celsius", "float32", 1),
+    Column("utilization_percent", "gpu", "utilization_percent", "float32", 1),
+    Column("memory_used_mb", "gpu", "memory_used_mb", "float32", 0),
+    Column("memory_total_mb", "gpu", "memory_total_mb", "float32", 0),
+    Column("memory_percent", "gpu", "memory_percent", "float32", 1),
+    Column("is_simulated", "gpu", "is_simulated", "bool"),
+    Column("intensity_g_per_kwh", "carbon", "intensity_g_per_kwh", "float32", 1),
+    Column("is_mocked", "carbon", "is_mocked", "bool"),
+    Column("is_stale", "carbon", "is_stale", "bool"),
+    Column("region", "carbon", "region", CATEGORY),
+    Column("emissions_g_per_second", "carbon", "emissions_g_per_second", "float64", 6),
+    Column("emissions_total_g", "carbon", "emissions_total_g", "float64", 4),
+    Column("suggestion", "carbon", "suggestion", CATEGORY),
+    Column("job_id", "job", "id", OBJECT),  # Every job has a new ID, so not dictionary-encoded
+    Column("active_jobs", "job", "active_jobs", "uint16"),
+    Column("job_running", "job", "running", "bool"),
+    Column("runtime_seconds", "job", "runtime_seconds", "float32", 1),
+    Column("energy_wh", "job", "energy_wh", "float64", 6),
+    Column("energy_source", "job", "energy_source", CATEGORY),
+    Column("energy_error_wh", "job", "energy_error_wh", "float64", 6),
+    Column("energy_drift_wh", "job", "energy_drift_wh", "float64", 6, nullable=True),
+]
+
+# Per-device columns, stored as (capacity, device_count) arrays (snapshot "gpus" list)
+DEVICE_SECTION = "gpus"
+DEVICE_SCHEMA = [
+    Column("device_name", DEVICE_SECTION, "name", CATEGORY),
+    Column("device_power_watts", DEVICE_SECTION, "power_watts", "float32", 2),
+    Column("device_temperature_celsius", DEVICE_SECTION, "temperature_celsius", "float32", 1),
+    Column("device_utilization_percent", DEVICE_SECTION, "utilization_percent", "float32", 1),
+    Column("device_memory_used_mb", DEVICE_SECTION, "memory_used_mb", "float32", 0),
+    Column("device_memory_total_mb", DEVICE_SECTION, "memory_total_mb", "float32", 0),
+    Column("device_memory_percent", DEVICE_SECTION, "memory_percent", "float32", 1),
+]
+
+
+def dictionary_encode(values) -> tuple:
+    """(codes, categories) of a sequence of values, in order of first appearance (None included)"""
+    codes: Dict[Any, int] = {}
+    return np.array([codes.setdefault(value, len(codes)) for value in values], dtype=np.uint32), list(codes)
+
+
+def _exact(value, places: Optional[int]) -> float:
+    """Convert a column value to float, undoing float32 noise by rounding"""
+    return float(value) if places is None else round(float(value), places)
+
+
+class TimeSeriesStore(RingBuffer):
+    """
+    Ring buffer that stores snapshots column-wise in preallocated NumPy arrays.
+
+    Strings that repeat on every sample (GPU name, region, suggestion) are
+    dictionary-encoded into uint16 codes; job IDs, which never repeat across
+    jobs, are kept per row. Records are only rebuilt as dicts
+    when read back; aggregates run directly on the columns. Tracked columns
+    also keep running aggregates that are updated on append and eviction, so
+    whole-window statistics cost O(1). Per-device readings live in 2-D columns
+    with one row per sample and one column per GPU.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        schema: List[Column] = SCHEMA,
+        tracked: tuple = TRACKED_COLUMNS,
+        device_count: int = 1,
+        device_schema: List[Column] = DEVICE_SCHEMA,
+        first_position: int = 0
+    ):
+        self.schema = schema
+        self.tracked = tracked
+        self.device_count = device_count
+        self.device_schema = device_schema
+        self._categories: Dict[str, List[str]] = {}
+        self._category_codes: Dict[str, Dict[str, int]] = {}
+        super().__init__(capacity, first_position)
+
+    @property
+    def bytes_per_sample(self) -> int:
+        """Storage cost of one sample across all columns"""
+        return sum(array[:1].nbytes for array in self._columns.values())
+
+    def _allocate(self):
+        self._columns: Dict[str, np.ndarray] = {}
+        for column in self.schema + self.device_schema:
+            dtype = np.uint16 if column.dtype == CATEGORY else column.dtype
+            shape = (self.capacity, self.device_count) if column.section == DEVICE_SECTION else self.capacity
+            self._columns[column.name] = np.empty(shape, dtype=object) if dtype == OBJECT else np.zeros(shape, dtype=dtype)
+            if column.dtype == CATEGORY:
+                self._categories.setdefault(column.name, [])
+                self._category_codes.setdefault(column.name, {})
+        self._device_keys = [column.key for column in self.device_schema]
+        self._running = {name: RunningStats() for name in self.tracked}
+        self._extrema = {name: SlidingExtrema(self._value_reader(name)) for name in self.tracked}
+
+    def _value_reader(self, name: str):
+        data = self._columns[name]
+        return lambda position: float(data[self._slot(position)])
+
+    def _encode(self, column: Column, value: str) -> int:
+        codes = self._category_codes[column.name]
+        code = codes.get(value)
+        if code is None:
+            code = len(codes)
+            if code > np.iinfo(np.uint16).max:
+                raise ValueError(f"Too many distinct values for column '{column.name}'")
+            codes[value] = code
+            self._categories[column.name].append(value)
+        return code
+
+    def _prepare(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Flatten a snapshot into column values, encoding categories before any eviction"""
+        values = {}
+        for column in self.schema:
+            value = item[column.key] if column.section is None else item[column.section][column.key]
+            if column.dtype == CATEGORY:
+                value = self._encode(column, value)
+            elif value is None and column.nullable:
+                value = np.nan
+            values[column.name] = value
+        devices = item.get(DEVICE_SECTION, [])[:self.device_count]
+        for column in self.device_schema:
+            device_values = [device[column.key] for device in devices]
+            if column.dtype == CATEGORY:
+                device_values = [self._encode(column, value) for value in device_values]
+            values[column.name] = device_values
+        return values
+
+    def _write(self, slot: int, values: Dict[str, Any]):
+        for column in self.schema:
+            self._columns[column.name][slot] = values[column.name]
+        for column in self.device_schema:
+            device_values = values[column.name]
+            self._columns[column.name][slot, :len(device_values)] = device_values
+        # Read back the stored value so later removal subtracts exactly what was added
+        for name in self.tracked:
+            value = float(self._columns[name][slot])
+            self._running[name].add(value)
+            self._extrema[name].push(self._total, value)
+
+    def _evict(self, slot: int):
+        oldest = self._total - self._size
+        for name in self.tracked:
+            self._running[name].remove(float(self._columns[name][slot]))
+            self._extrema[name].evict_before(oldest + 1)
+
+    def _read_slots(self, lo: int, hi: int) -> List[Dict[str, Any]]:
+        # Convert each column once, then assemble rows from plain Python values
+        values = []
+        for column in self.schema:
+            data = self._columns[column.name][lo:hi].tolist()
+            if column.dtype == CATEGORY:
+                categories = self._categories[column.name]
+                data = [categories[code] for code in data]
+            elif column.nullable:
+                data = [None if value != value else (  # NaN marks a missing value
+                    value if column.decimals is None else round(value, column.decimals)) for value in data]
+            elif column.decimals is not None:
+                data = [round(value, column.decimals) for value in data]
+            values.append(data)
+
+        device_values = []
+        for column in self.device_schema:
+            data = self._columns[column.name][lo:hi].tolist()  # One list of devices per sample
+            if column.dtype == CATEGORY:
+                categories = self._categories[column.name]
+                data = [[categories[code] for code in row] for row in data]
+            elif column.decimals is not None:
+                data = [[round(value, column.decimals) for value in row] for row in data]
+            device_values.append(data)
+
+        records = []
+        for row, device_row in zip(zip(*values), zip(*device_values)):
+            record: Dict[str, Any] = {"gpu": {}, "carbon": {}, "job": {}}
+            for column, value in zip(self.schema, row):
+                if column.section is None:
+                    record[column.key] = value
+                else:
+                    record[column.section][column.key] = value
+            record["gpu"]["device_count"] = self.device_count
+            record[DEVICE_SECTION] = [
+                dict(zip(self._device_keys, device), index=index)
+                for index, device in enumerate(zip(*device_row))
+            ]
+            record["carbon"]["emissions_g_per_minute"] = round(
+                record["carbon"]["emissions_g_per_second"] * 60, 4
+            )
+            records.append(record)
+        return records
+
+    def _read(self, start: int, stop: int) -> List[Dict[str, Any]]:
+        records = super()._read(start, stop)
+        # A sample's sequence number is its absolute position
+        for seq, record in enumerate(records, start):
+            record["seq"] = seq
+        return records
+
+    def column(self, name: str, start: Optional[int] = None, stop: Optional[int] = None) -> np.ndarray:
+        """Copy one column for absolute positions [start, stop) in time order"""
+        with self._lock:
+            start, stop = self._clip(start, stop)
+            data = self._columns[name]
+            segments = [data[lo:hi] for lo, hi in self._segments(start, stop)]
+            if not segments:
+                return data[:0].copy()
+            return np.concatenate(segments)
+
+    def export_columns(
+        self,
+        start: Optional[int] = None,
+        stop: Optional[int] = None,
+        names: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Copy the columns `names` (default: all) for positions [start, stop)
+        in one consistent read.
+
+        Numeric columns are NumPy arrays; category columns are (codes,
+        categories) pairs so binary encoders can keep them dictionary-encoded.
+        Per-device columns are split into one column per GPU (`name_<index>`).
+        The sequence numbers come first, as `seq`.
+        """
+        result: Dict[str, Any] = {}
+        with self._lock:
+            start, stop = self._clip(start, stop)
+            segments = self._segments(start, stop)
+            result["seq"] = np.arange(start, stop, dtype=np.int64)
+            for column in self.schema + self.device_schema:
+                if names is not None and column.name not in names:
+                    continue
+                data = self._columns[column.name]
+                values = np.concatenate([data[lo:hi] for lo, hi in segments]) if segments else data[:0].copy()
+                if column.section == DEVICE_SECTION:
+                    parts = {
+                        f"{column.name}_{index}": np.ascontiguousarray(values[:, index])
+                        for index in range(self.device_count)
+                    }
+                else:
+                    parts = {column.name: values}
+                for name, part in parts.items():
+                    if column.dtype == CATEGORY:
+                        result[name] = (part, list(self._categories[column.name]))
+                    elif column.dtype == OBJECT:
+                        result[name] = dictionary_encode(part.tolist())
+                    else:
+                        result[name] = part
+        return result
+
+    def positions_between(
+        self,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None
+    ):
+        """
+        Binary-search the timestamp column for samples with
+        start_time <= timestamp <= end_time. Returns absolute positions
+        [start, stop) in O(log n); relies on samples being appended in time order.
+        """
+        with self._lock:
+            start = stop = self._total - self._size
+            for lo, hi in self._segments(start, self._total):
+                timestamps = self._columns["timestamp"][lo:hi]
+                # Searching each sorted segment and summing equals a search of their concatenation
+                if start_time is not None:
+                    start += int(np.searchsorted(timestamps, start_time, side="left"))
+                stop += hi - lo if end_time is None else int(
+                    np.searchsorted(timestamps, end_time, side="right"))
+            stop = max(start, stop)
+            return start, stop
+
+    def aggregate(
+        self,
+        names: List[str],
+        start: Optional[int] = None,
+        stop: Optional[int] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Vectorized count/min/max/mean/stddev and first/last values of numeric
+        columns over absolute positions [start, stop).
+        """
+        decimals = {column.name: column.decimals for column in self.schema}
+        result = {}
+        with self._lock:
+            start, stop = self._clip(start, stop)
+            segments = self._segments(start, stop)
+            count = stop - start
+            for name in names:
+                data = self._columns[name]
+                places = decimals.get(name)
+                if count == 0:
+                    result[name] = {"count": 0, "min": None, "max": None, "avg": None,
+                                    "stddev": None, "first": None, "last": None}
+                    continue
+                parts = [data[lo:hi] for lo, hi in segments]
+                mean = sum(part.sum(dtype=np.float64) for part in parts) / count
+                squared = sum(np.square(part - mean, dtype=np.float64).sum() for part in parts)
+                result[name] = {
+                    "count": count,
+                    "min": _exact(min(part.min() for part in parts), places),
+                    "max": _exact(max(part.max() for part in parts), places),
+                    "avg": float(mean),
+                    "stddev": float(np.sqrt(squared / count)),
+                    "first": _exact(parts[0][0], places),
+                    "last": _exact(parts[-1][-1], places)
+                }
+        return result
+
+    def running_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        O(1) count/min/max/mean/stddev and first/last values of the tracked
+        columns, plus the count and first/last timestamps of the window.
+        """
+        decimals = {column.name: column.decimals for column in self.schema}
+        result = {}
+        with self._lock:
+            timestamps = self._columns["timestamp"]
+            result["timestamp"] = {
+                "count": self._size,
+                "first": float(timestamps[self._slot(self._total - self._size)]) if self._size else None,
+                "last": float(timestamps[self._slot(self._total - 1)]) if self._size else None
+            }
+            for name in self.tracked:
+                places = decimals.get(name)
+                running, extrema = self._running[name], self._extrema[name]
+                if running.count == 0:
+                    result[name] = {"count": 0, "min": None, "max": None, "avg": None,
+                                    "stddev": None, "first": None, "last": None}
+                    continue
+                data = self._columns[name]
+                result[name] = {
+                    "count": running.count,
+                    "min": _exact(extrema.min, places),
+                    "max": _exact(extrema.max, places),
+                    "avg": running.mean,
+                    "stddev": running.stddev,
+                    "first": _exact(data[self._slot(self._total - self._size)], places),
+                    "last": _exact(data[self._slot(self._total - 1)], places)
+                }
+        return result
+
+    def _clip(self, start: Optional[int], stop: Optional[int]):
+        """Clamp absolute positions to the retained range; caller holds the lock"""
+        oldest = self._total - self._size
+        start = oldest if start is None else max(start, oldest)
+        stop = self._total if stop is None else min(stop, self._total)
+        return start, max(start, stop)
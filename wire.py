@@ -0,0 +1,197 @@
+"""
+Wire Formats - EcoCompute AI / GreenGL
+Columnar binary encodings of history (Arrow IPC stream, MessagePack)
+"""
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# Try to import pyarrow and msgpack (optional, only needed for binary responses)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+MSGPACK_MIMETYPE = "application/msgpack"
+PARQUET_MIMETYPE = "application/vnd.apache.parquet"
+
+# Binary mimetype -> whether its encoder is importable
+AVAILABLE_FORMATS = {
+    ARROW_MIMETYPE: ARROW_AVAILABLE,
+    MSGPACK_MIMETYPE: MSGPACK_AVAILABLE,
+    PARQUET_MIMETYPE: ARROW_AVAILABLE,
+}
+
+
+def _arrow_array(value: Any) -> "pa.Array":
+    """One exported column as an Arrow array; categories stay dictionary-encoded"""
+    if isinstance(value, tuple):
+        codes, categories = value
+        # None is a category in the store; in Arrow it becomes a null index
+        missing = [code for code, category in enumerate(categories) if category is None]
+        mask = np.isin(codes, missing) if missing else None
+        dictionary = pa.array(["" if category is None else category for category in categories], type=pa.string())
+        return pa.DictionaryArray.from_arrays(pa.array(codes, mask=mask), dictionary)
+    return pa.array(value, mask=_missing(value))
+
+
+def _missing(values: np.ndarray) -> Optional[np.ndarray]:
+    """Mask of the NaNs a float column stores for None, or None when there are none"""
+    if values.dtype.kind != "f":
+        return None
+    mask = np.isnan(values)
+    return mask if mask.any() else None
+
+
+def _column_length(value: Any) -> int:
+    return len(value[0]) if isinstance(value, tuple) else len(value)
+
+
+def _arrow_batch(columns: Dict[str, Any], schema: Optional["pa.Schema"] = None) -> "pa.RecordBatch":
+    """One chunk of exported columns as a record batch (conformed to `schema` if given)"""
+    if schema is None:
+        return pa.RecordBatch.from_arrays([_arrow_array(value) for value in columns.values()], list(columns))
+    rows = _column_length(next(iter(columns.values()))) if columns else 0
+    # Later chunks follow the first chunk's columns (e.g. a GPU missing from some samples)
+    arrays = [
+        _arrow_array(columns[field.name]) if field.name in columns else pa.nulls(rows, field.type)
+        for field in schema
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _arrow_batches(chunks: Iterable[Dict[str, Any]]) -> Iterator["pa.RecordBatch"]:
+    """Record batches of exported column chunks, all conformed to the first chunk's schema"""
+    schema = None
+    for columns in chunks:
+        batch = _arrow_batch(columns, schema)
+        schema = batch.schema
+        yield batch
+
+
+class _ByteSink:
+    """Write-only file object that hands out what has been written so far"""
+
+    closed = False
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def iter_arrow_stream(chunks: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """
+    Encode exported column chunks as one Arrow IPC stream, yielding each
+    record batch's bytes as soon as it is written. Category dictionaries
+    that grow between chunks are sent as dictionary replacements.
+    """
+    sink = _ByteSink()
+    writer = None
+    for batch in _arrow_batches(chunks):
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, batch.schema)
+        writer.write_batch(batch)
+        yield sink.take()
+    if writer is None:
+        return
+    writer.close()
+    yield sink.take()
+
+
+def encode_arrow(columns: Dict[str, Any]) -> bytes:
+    """A single chunk of exported columns as a complete Arrow IPC stream"""
+    return b"".join(iter_arrow_stream([columns]))
+
+
+def iter_parquet(chunks: Iterable[Dict[str, Any]], compression: str = "zstd") -> Iterator[bytes]:
+    """
+    Encode exported column chunks as a Parquet file, one row group per chunk,
+    yielding each row group's bytes as soon as it is written (footer last).
+    """
+    sink = _ByteSink()
+    writer = None
+    for batch in _arrow_batches(chunks):
+        if writer is None:
+            writer = pq.ParquetWriter(sink, batch.schema, compression=compression)
+        if batch.num_rows:  # An empty export is just the schema
+            writer.write_batch(batch, row_group_size=batch.num_rows)
+        yield sink.take()
+    if writer is None:
+        return
+    writer.close()
+    yield sink.take()
+
+
+def write_parquet(chunks: Iterable[Dict[str, Any]], path: str, compression: str = "zstd") -> int:
+    """Write exported column chunks to a Parquet file at `path`; returns the row count"""
+    rows = 0
+    writer = None
+    try:
+        for batch in _arrow_batches(chunks):
+            if writer is None:
+                writer = pq.ParquetWriter(path, batch.schema, compression=compression)
+            if batch.num_rows:
+                writer.write_batch(batch, row_group_size=batch.num_rows)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def _plain_column(value: Any) -> list:
+    """One exported column as a list of Python values (categories decoded, NaN as None)"""
+    if isinstance(value, tuple):
+        codes, categories = value
+        return np.array(categories, dtype=object)[codes].tolist() if categories else [None] * len(codes)
+    mask = _missing(value)
+    if mask is None:
+        return value.tolist()
+    return [None if missing else item for item, missing in zip(value.tolist(), mask.tolist())]
+
+
+def encode_msgpack(columns: Dict[str, Any], **fields) -> bytes:
+    """
+    Exported columns as one MessagePack map: {"count", "columns": {name: [values]}}
+    plus any extra top-level `fields`.
+    """
+    count = _column_length(next(iter(columns.values()))) if columns else 0
+    return msgpack.packb(
+        {**fields, "count": count, "columns": {name: _plain_column(value) for name, value in columns.items()}},
+        use_single_float=False
+    )
+
+
+def iter_msgpack_stream(chunks: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """Encode exported column chunks as consecutive MessagePack maps (read with msgpack.Unpacker)"""
+    for columns in chunks:
+        yield encode_msgpack(columns)